@@ -1,14 +1,19 @@
 '''
 python3 augmented_json.py --src_json_path nvgesture.json --dst_json_path nvgesture_aug.json
+
+Adds the list of the augmentation views of the training videos to the annotation file. The views are applied
+when the videos are loaded (see datasets/augmentation_views.py), with the labels of the gestures mirrored
+by the flip exchanged, so neither the augmented videos nor their frames are written.
 '''
 
 
-import os
 import argparse
-from tqdm import tqdm
 import json
-import copy
-import random
+
+
+FLIP = ['flip']
+ROTATIONS = ['-10', '-5', '5', '10']
+FACTORS = ['0.8', '0.9', '1.1', '1.2']
 
 
 def parse_opts():
@@ -26,149 +31,22 @@ def load_json(data_file_path):
         return json.load(data_file)
 
 
+def get_views():
+    views = list(FLIP)
+    for val in ROTATIONS:
+        views += ['rot_{}'.format(val), 'flip_rot_{}'.format(val)]
+    for val in FACTORS:
+        views += ['scale_{}'.format(val), 'flip_scale_{}'.format(val), 'bright_{}'.format(val), 'flip_bright_{}'.format(val)]
+    return views
+
+
 if __name__ == "__main__":    
     opt = parse_opts()
     
     ann_json = load_json(opt.src_json_path)
-    new_json = copy.deepcopy(ann_json)
-    
-    data_iter = tqdm(ann_json['database'].items())
-    for key, value in data_iter:
-        folders = key.split('/')
-        
-        # Augment only training set
-        if value['subset'] == 'training':
-            
-            # Rotation-dependent label
-            if value['annotations']['label'] in [1, 5, 20]:
-                new_video_id = os.path.join(folders[0], '{}-flip'.format(folders[1]), folders[2])
-                new_json['database'][new_video_id] = {'subset': 'training', 
-                                'annotations': {"label": value['annotations']['label'] + 1},
-                                'start': value['start'],
-                                'end': value['end']}
-                for val in ['-10', '-5', '5', '10']:
-                    new_video_id = os.path.join(folders[0], '{}-rot_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label']},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                    new_video_id = os.path.join(folders[0], '{}-flip_rot_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label'] + 1},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                for val in ['0.8', '0.9', '1.1', '1.2']:
-                    new_video_id = os.path.join(folders[0], '{}-scale_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label']},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                    new_video_id = os.path.join(folders[0], '{}-flip_scale_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label'] + 1},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                    new_video_id = os.path.join(folders[0], '{}-bright_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label']},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                    new_video_id = os.path.join(folders[0], '{}-flip_bright_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label'] + 1},
-                                    'start': value['start'],
-                                    'end': value['end']}
-            
-            # Rotation-dependent label
-            elif value['annotations']['label'] in [2, 6, 21]:
-                new_video_id = os.path.join(folders[0], '{}-flip'.format(folders[1]), folders[2])
-                new_json['database'][new_video_id] = {'subset': 'training', 
-                                'annotations': {"label": value['annotations']['label'] - 1},
-                                'start': value['start'],
-                                'end': value['end']}
-                for val in ['-10', '-5', '5', '10']:
-                    new_video_id = os.path.join(folders[0], '{}-rot_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label']},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                    new_video_id = os.path.join(folders[0], '{}-flip_rot_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label'] - 1},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                for val in ['0.8', '0.9', '1.1', '1.2']:
-                    new_video_id = os.path.join(folders[0], '{}-scale_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label']},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                    new_video_id = os.path.join(folders[0], '{}-flip_scale_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label'] - 1},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                    new_video_id = os.path.join(folders[0], '{}-bright_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label']},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                    new_video_id = os.path.join(folders[0], '{}-flip_bright_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label'] - 1},
-                                    'start': value['start'],
-                                    'end': value['end']}
-            
-            # No rotation-dependent label
-            else:
-                new_video_id = os.path.join(folders[0], '{}-flip'.format(folders[1]), folders[2])
-                new_json['database'][new_video_id] = {'subset': 'training', 
-                                'annotations': {"label": value['annotations']['label']},
-                                'start': value['start'],
-                                'end': value['end']}
-                for val in ['-10', '-5', '5', '10']:
-                    new_video_id = os.path.join(folders[0], '{}-rot_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label']},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                    new_video_id = os.path.join(folders[0], '{}-flip_rot_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label']},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                for val in ['0.8', '0.9', '1.1', '1.2']:
-                    new_video_id = os.path.join(folders[0], '{}-scale_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label']},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                    new_video_id = os.path.join(folders[0], '{}-flip_scale_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label']},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                    new_video_id = os.path.join(folders[0], '{}-bright_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label']},
-                                    'start': value['start'],
-                                    'end': value['end']}
-                    new_video_id = os.path.join(folders[0], '{}-flip_bright_{}'.format(folders[1], val), folders[2])
-                    new_json['database'][new_video_id] = {'subset': 'training', 
-                                    'annotations': {"label": value['annotations']['label']},
-                                    'start': value['start'],
-                                    'end': value['end']}
-        
-        data_iter.set_description('Dictionary creation.')
     
-    keys = list(new_json['database'].keys())
-    random.seed()
-    random.shuffle(keys)
-    shuffle_json = dict()
-    shuffle_json['labels'] = ann_json['labels']
-    shuffle_json['database'] = dict()
-    for key in keys:
-        shuffle_json['database'][key] = new_json['database'][key]
+    # Augment only training set
+    ann_json['augmentations'] = {'training': get_views()}
     
     with open(opt.dst_json_path, 'w') as dst_file:
-        json.dump(shuffle_json, dst_file)
\ No newline at end of file
+        json.dump(ann_json, dst_file)
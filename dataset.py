@@ -17,7 +17,12 @@ def get_training_set(opt, spatial_transform, temporal_transform, target_transfor
             temporal_transform=temporal_transform,
             target_transform=target_transform,
             sample_duration=opt.sample_duration,
-            cnn_dim=opt.cnn_dim)
+            cnn_dim=opt.cnn_dim,
+            frame_store=opt.frame_store,
+            io_threads=opt.io_threads,
+            max_inflight_frames=opt.max_inflight_frames,
+            jpeg_draft=opt.jpeg_draft,
+            index_dir=opt.index_dir)
     elif opt.dataset == 'isogd':
         training_data = IsoGD(
             opt.video_path,
@@ -28,7 +33,13 @@ def get_training_set(opt, spatial_transform, temporal_transform, target_transfor
             temporal_transform=temporal_transform,
             target_transform=target_transform,
             sample_duration=opt.sample_duration,
-            cnn_dim=opt.cnn_dim)
+            cnn_dim=opt.cnn_dim,
+            frame_store=opt.frame_store,
+            io_threads=opt.io_threads,
+            max_inflight_frames=opt.max_inflight_frames,
+            jpeg_draft=opt.jpeg_draft,
+            video_backend=opt.video_backend,
+            index_dir=opt.index_dir)
     elif opt.dataset == 'nvgesture':
         training_data = NVGesture(
             opt.video_path,
@@ -39,7 +50,13 @@ def get_training_set(opt, spatial_transform, temporal_transform, target_transfor
             temporal_transform=temporal_transform,
             target_transform=target_transform,
             sample_duration=opt.sample_duration,
-            cnn_dim=opt.cnn_dim)
+            cnn_dim=opt.cnn_dim,
+            frame_store=opt.frame_store,
+            io_threads=opt.io_threads,
+            max_inflight_frames=opt.max_inflight_frames,
+            jpeg_draft=opt.jpeg_draft,
+            video_backend=opt.video_backend,
+            index_dir=opt.index_dir)
     return training_data
 
 
@@ -57,7 +74,14 @@ def get_validation_set(opt, spatial_transform, temporal_transform, target_transf
             temporal_transform,
             target_transform,
             sample_duration=opt.sample_duration,
-            cnn_dim=opt.cnn_dim)
+            cnn_dim=opt.cnn_dim,
+            frame_store=opt.frame_store,
+            io_threads=opt.io_threads,
+            max_inflight_frames=opt.max_inflight_frames,
+            jpeg_draft=opt.jpeg_draft,
+            frame_cache=opt.frame_cache,
+            sample_size=opt.sample_size,
+            index_dir=opt.index_dir)
     elif opt.dataset == 'isogd':
         validation_data = IsoGD(
             opt.video_path,
@@ -69,7 +93,15 @@ def get_validation_set(opt, spatial_transform, temporal_transform, target_transf
             temporal_transform,
             target_transform,
             sample_duration=opt.sample_duration,
-            cnn_dim=opt.cnn_dim)
+            cnn_dim=opt.cnn_dim,
+            frame_store=opt.frame_store,
+            io_threads=opt.io_threads,
+            max_inflight_frames=opt.max_inflight_frames,
+            jpeg_draft=opt.jpeg_draft,
+            video_backend=opt.video_backend,
+            frame_cache=opt.frame_cache,
+            sample_size=opt.sample_size,
+            index_dir=opt.index_dir)
     elif opt.dataset == 'nvgesture':
         validation_data = NVGesture(
             opt.video_path,
@@ -81,11 +113,22 @@ def get_validation_set(opt, spatial_transform, temporal_transform, target_transf
             temporal_transform,
             target_transform,
             sample_duration=opt.sample_duration,
-            cnn_dim=opt.cnn_dim)
+            cnn_dim=opt.cnn_dim,
+            frame_store=opt.frame_store,
+            io_threads=opt.io_threads,
+            max_inflight_frames=opt.max_inflight_frames,
+            jpeg_draft=opt.jpeg_draft,
+            video_backend=opt.video_backend,
+            frame_cache=opt.frame_cache,
+            sample_size=opt.sample_size,
+            index_dir=opt.index_dir)
     return validation_data
 
 
-def get_test_set(opt, spatial_transform, temporal_transform, target_transform):
+def get_test_set(opt, spatial_transform, temporal_transform, target_transform, n_samples=None):
+    # n_samples: samples for each video, opt.n_val_samples by default (1 for the video-level dense test)
+    if n_samples is None:
+        n_samples = opt.n_val_samples
     assert opt.dataset in ['jester', 'isogd', 'nvgesture']
     assert opt.test_subset in ['val', 'test']
 
@@ -99,34 +142,57 @@ def get_test_set(opt, spatial_transform, temporal_transform, target_transform):
             opt.annotation_path,
             opt.modalities,
             subset,
-            opt.n_val_samples,
+            n_samples,
             spatial_transform,
             temporal_transform,
             target_transform,
             sample_duration=opt.sample_duration,
-            cnn_dim=opt.cnn_dim)
+            cnn_dim=opt.cnn_dim,
+            frame_store=opt.frame_store,
+            io_threads=opt.io_threads,
+            max_inflight_frames=opt.max_inflight_frames,
+            jpeg_draft=opt.jpeg_draft,
+            frame_cache=opt.frame_cache,
+            sample_size=opt.sample_size,
+            index_dir=opt.index_dir)
     elif opt.dataset == 'isogd':
         test_data = IsoGD(
             opt.video_path,
             opt.annotation_path,
             opt.modalities,
             subset,
-            opt.n_val_samples,
+            n_samples,
             spatial_transform,
             temporal_transform,
             target_transform,
             sample_duration=opt.sample_duration,
-            cnn_dim=opt.cnn_dim)
+            cnn_dim=opt.cnn_dim,
+            frame_store=opt.frame_store,
+            io_threads=opt.io_threads,
+            max_inflight_frames=opt.max_inflight_frames,
+            jpeg_draft=opt.jpeg_draft,
+            video_backend=opt.video_backend,
+            frame_cache=opt.frame_cache,
+            sample_size=opt.sample_size,
+            index_dir=opt.index_dir)
     elif opt.dataset == 'nvgesture':
         test_data = NVGesture(
             opt.video_path,
             opt.annotation_path,
             opt.modalities,
             subset,
-            opt.n_val_samples,
+            n_samples,
             spatial_transform,
             temporal_transform,
             target_transform,
             sample_duration=opt.sample_duration,
-            cnn_dim=opt.cnn_dim)
+            cnn_dim=opt.cnn_dim,
+            frame_store=opt.frame_store,
+            io_threads=opt.io_threads,
+            max_inflight_frames=opt.max_inflight_frames,
+            jpeg_draft=opt.jpeg_draft,
+            video_backend=opt.video_backend,
+            frame_cache=opt.frame_cache,
+            sample_size=opt.sample_size,
+            index_dir=opt.index_dir)
     return test_data
@@ -0,0 +1,123 @@
+'''
+Virtual augmentation of the videos (NVGesture).
+
+An augmented video is a view of a source video: the source frames and a fixed transform, applied when the clip
+is loaded, instead of a copy of the frames written on disk by utils/augment_nvgesture.py.
+A view is named by its transforms, applied in this order:
+
+flip                horizontal flip, the labels of the gestures mirrored by the flip are exchanged (FLIP_LABELS)
+rot_<angle>         rotation of angle degrees (counter-clockwise)
+scale_<factor>      resize of the frames by factor
+bright_<factor>     multiplication of the values by factor
+
+e.g. 'flip_rot_-10', 'scale_0.8', 'flip_bright_1.1'. The views are listed in the annotation file, for each subset:
+
+{
+    "labels": [...],
+    "database": {...},
+    "augmentations": {"training": ["flip", "rot_-10", "flip_rot_-10", ...]}
+}
+
+and each annotated video of the subset gives one more sample for each view, with id
+class_01/subject1_r0-flip_rot_-10/sk_color. The annotation files listing the augmented videos one by one
+(ids with the view appended to the subject folder, as in the older nvgesture_aug.json) are read in the same way,
+from the frames of the source video.
+'''
+
+import re
+import functools
+import torch
+
+from spatial_transforms import Compose, RandomHorizontalFlip, RandomRotate, RandomResize, MultiplyValues
+
+
+# labels (of the annotation file) of the gestures that are the mirror image of each other
+FLIP_LABELS = {1: 2, 2: 1, 5: 6, 6: 5, 20: 21, 21: 20}
+VIEW_PATTERN = re.compile(r'^(.+)-((?:flip|rot_|scale_|bright_).*)$')
+
+
+def parse_view(view):
+    """
+    Returns the (transform, value) pairs of a view name, value being None for flip.
+    """
+    params = []
+    tokens = view.split('_')
+    i = 0
+    while i < len(tokens):
+        if tokens[i] == 'flip':
+            params.append(('flip', None))
+            i += 1
+        elif tokens[i] in ['rot', 'scale', 'bright'] and i + 1 < len(tokens):
+            params.append((tokens[i], float(tokens[i + 1])))
+            i += 2
+        else:
+            raise ValueError('invalid augmentation view: {}'.format(view))
+    return params
+
+
+def is_flipped(view):
+    return any(name == 'flip' for name, value in parse_view(view))
+
+
+def flip_label(label, view):
+    """Returns the annotation label of the view of a video with the given label."""
+    if view and is_flipped(view):
+        return FLIP_LABELS.get(label, label)
+    return label
+
+
+def get_view_id(video_id, view):
+    """Id of the view of a video: the view is appended to the subject folder, e.g. class_01/subject1_r0-flip/sk_color."""
+    folders = video_id.split('/')
+    folders[-2] = '{}-{}'.format(folders[-2], view)
+    return '/'.join(folders)
+
+
+def split_view_id(video_id):
+    """Returns the id of the source video and the view of an augmented video id ('' if it is not augmented)."""
+    folders = video_id.split('/')
+    for i, folder in enumerate(folders):
+        match = VIEW_PATTERN.match(folder)
+        if match is not None:
+            folders[i] = match.group(1)
+            return '/'.join(folders), match.group(2)
+    return video_id, ''
+
+
+class ViewTransform(object):
+    """
+    Applies a view to the frames of a clip, with the clip implementations of the random spatial transforms
+    and their parameters fixed to the ones of the view.
+    Args:
+        view (string): Name of the view.
+    Returns:
+        (T x H x W x C) uint8 tensor, as taken by ``spatial_transforms.Compose``.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        transforms = []
+        for name, value in parse_view(view):
+            if name == 'flip':
+                t = RandomHorizontalFlip()
+                t.p = 0.
+            elif name == 'rot':
+                t = RandomRotate()
+                t.rotate_angle = value
+            elif name == 'scale':
+                t = RandomResize()
+                t.resize_const = value
+            else:
+                t = MultiplyValues()
+                t.sample = value
+            transforms.append(t)
+        self.transform = Compose(transforms)
+
+    def __call__(self, clip):
+        clip = self.transform(clip)
+        return clip.permute(0, 2, 3, 1).clamp_(0, 255).round_().to(torch.uint8)
+
+
+@functools.lru_cache(maxsize=None)
+def get_view_transform(view):
+    return ViewTransform(view)
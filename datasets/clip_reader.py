@@ -0,0 +1,157 @@
+'''
+Reading of the clips of a sample.
+
+File reads and JPEG decoding release the GIL, so they are overlapped with thread pools of the DataLoader worker:
+- the modalities of a sample (e.g. RGB and D) share the frame indices, so their frames are read in one pass,
+  submitting the modalities together, and the transformed clips are written in a single preallocated tensor
+  instead of being stacked afterwards (MultiModalReader, stack_clips);
+- the frames of a clip are read and decoded by a pool of I/O threads, a bounded number at a time
+  (PrefetchingVideoLoader, enabled with --io_threads).
+'''
+
+import os
+import collections
+import functools
+import torch
+from concurrent.futures import ThreadPoolExecutor
+
+from datasets.frame_store import read_pack_frames, get_pack_path, pil_bytes_loader
+
+
+_pools = dict()
+
+
+def get_thread_pool(name, max_workers):
+    """
+    Returns the thread pool with the given name of the current process, created at the first call:
+    the threads of a pool do not survive the fork of the DataLoader workers.
+    """
+    key = (os.getpid(), name)
+    if key not in _pools:
+        _pools[key] = ThreadPoolExecutor(max_workers)
+    return _pools[key]
+
+
+class MultiModalReader(object):
+    """
+    Reads the frames of the modalities of a sample at the same frame indices.
+    Args:
+        max_workers (int): Threads of the pool of each process (one for each modality is enough).
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+
+    def __call__(self, reads, frame_indices, sample_duration):
+        """
+        Args:
+            reads (list): (loader, video path) of each modality, loader as video_loader.
+            frame_indices (list): Frame indices of the sample.
+            sample_duration (int): As in video_loader.
+        Returns:
+            list: Frames of each modality, cut to the frames available in all the modalities.
+        """
+        if len(reads) == 1 or self.max_workers <= 1:
+            clips = [loader(path, frame_indices, sample_duration) for loader, path in reads]
+        else:
+            pool = get_thread_pool('modalities', self.max_workers)
+            futures = [pool.submit(loader, path, frame_indices, sample_duration) for loader, path in reads]
+            clips = [future.result() for future in futures]
+        length = min(len(clip) for clip in clips)
+        return [clip[:length] for clip in clips]
+
+
+def frame_paths(video_dir_path, frame_indices, image_name):
+    return [os.path.join(video_dir_path, image_name.format(i)) for i in frame_indices]
+
+
+def packed_frames(video_dir_path, frame_indices):
+    return read_pack_frames(get_pack_path(video_dir_path), frame_indices)
+
+
+class PrefetchingVideoLoader(object):
+    """
+    Video loader with the interface of video_loader, submitting the reads and the decoding of the frames
+    of a clip to the I/O thread pool of the process, with at most max_inflight frames submitted at a time.
+    As in video_loader, the clip ends at the first missing frame.
+    Args:
+        frame_sources (callable): Function taking (video_dir_path, frame_indices) and returning the source
+            of each frame (file path or encoded bytes).
+        image_loader (callable): Function loading a frame from its source.
+        n_threads (int): Threads of the I/O pool of each process.
+        max_inflight (int): Maximum number of frames submitted and not yet collected.
+    """
+
+    def __init__(self, frame_sources, image_loader, n_threads, max_inflight):
+        self.frame_sources = frame_sources
+        self.image_loader = image_loader
+        self.n_threads = n_threads
+        self.max_inflight = max(1, max_inflight)
+
+    def _load(self, source):
+        try:
+            return self.image_loader(source)
+        except FileNotFoundError:
+            return None
+
+    def __call__(self, video_dir_path, frame_indices, sample_duration):
+        pool = get_thread_pool('io', self.n_threads)
+        sources = iter(self.frame_sources(video_dir_path, frame_indices))
+        futures = collections.deque()
+        video = []
+        while True:
+            for source in sources:
+                futures.append(pool.submit(self._load, source))
+                if len(futures) >= self.max_inflight:
+                    break
+            if len(futures) == 0:
+                return video
+            frame = futures.popleft().result()
+            if frame is None:
+                for future in futures:
+                    future.cancel()
+                return video
+            video.append(frame)
+
+
+def get_prefetching_video_loader(frame_store, image_loader, image_name, n_threads, max_inflight, draft_size=None):
+    """
+    Args:
+        frame_store (string): Storage format of the frames (jpeg | packed).
+        image_loader (callable): Loader of the frame files of the jpeg store.
+        image_name (string): Format of the frame file names of the jpeg store, e.g. 'image_{:05d}.jpg'.
+        draft_size (tuple, optional): Reduced (width, height) at which the frames of the packed store are decoded.
+    """
+    if frame_store == 'packed':
+        image_loader = functools.partial(pil_bytes_loader, draft_size=draft_size)
+        return PrefetchingVideoLoader(packed_frames, image_loader, n_threads, max_inflight)
+    return PrefetchingVideoLoader(functools.partial(frame_paths, image_name=image_name), image_loader, n_threads, max_inflight)
+
+
+def stack_clips(clips, spatial_transform, cnn_dim):
+    """
+    Transforms the clips of the modalities of a sample and returns them in a single tensor,
+    (M x C x T x H x W) for the 3D CNNs and (M x T x C x H x W) for the 2D CNNs.
+    The tensor is allocated after the first modality, and spatial_transform (``spatial_transforms.Compose``)
+    writes the following ones directly in it.
+    """
+    out = None
+    for m, clip in enumerate(clips):
+        layout = getattr(spatial_transform, 'clip_layout', 'TCHW')
+        permute = cnn_dim == 3 and layout == 'TCHW'
+        if spatial_transform is not None:
+            spatial_transform.randomize_parameters()
+            if out is not None:
+                spatial_transform(clip, out=out[m].permute(1, 0, 2, 3) if permute else out[m])
+                continue
+            clip = spatial_transform(clip)     # all the frames at once
+        else:
+            clip = torch.stack(clip, 0)
+        if permute:
+            clip = clip.permute(1, 0, 2, 3)
+        if len(clips) == 1:
+            return clip.unsqueeze(0)
+        if out is None:
+            out = clip.new_empty((len(clips),) + clip.shape)
+        out[m] = clip
+    return out
@@ -0,0 +1,90 @@
+'''
+Video-level dataset for dense multi-clip testing.
+
+The clips of a video (e.g. the sliding windows of TemporalSlidingWindows) overlap, so instead of one sample for
+each clip, which reads, decodes and transforms the shared frames once for each clip, a sample is a whole video:
+the distinct frames of all its clips are read and transformed once, in a single buffer, and returned together
+with the position of the frames of each clip in the buffer. The clips are then taken from the buffer on the device
+(expand_clips), as strided views when they are evenly spaced, so the cost of the test scales with the distinct
+frames of the videos instead of with clips x sample_duration.
+'''
+
+import numpy as np
+import torch
+import torch.utils.data as data
+
+from datasets.clip_reader import stack_clips
+
+
+class DenseClipDataset(data.Dataset):
+    """
+    Args:
+        dataset (NVGesture, IsoGD or Jester): Dataset with one sample for each video (n_samples_for_each_video=1),
+            whose loader, spatial and target transforms are used for the frames of the video.
+        temporal_transform (callable): Function taking the frame indices of a video and returning the (n_clips x T)
+            frame indices of its clips, e.g. ``temporal_transforms.TemporalSlidingWindows``.
+    Returns:
+        tuple: (frames, positions, target), frames being the (M x C x U x H x W) tensor of the U distinct frames of the
+        clips ((M x U x C x H x W) for the 2D CNNs) and positions the (n_clips x T) positions of the frames of each
+        clip in it.
+    """
+
+    def __init__(self, dataset, temporal_transform):
+        self.dataset = dataset
+        self.temporal_transform = temporal_transform
+        self.class_names = dataset.class_names
+
+    def __getitem__(self, index):
+        dataset = self.dataset
+        sample = dataset.data[index]
+        clips = self.temporal_transform(sample['frame_indices'])
+        frame_indices, positions = np.unique(clips, return_inverse=True)
+
+        reads = [(dataset.cache_loaders.get(modality, dataset.loader), sample['videos'][modality]) for modality in dataset.modalities]
+        frames_list = dataset.reader(reads, frame_indices, dataset.sample_duration)
+        # the loaders stop at the first missing frame, which is replaced by the last one read
+        positions = np.minimum(positions.reshape(clips.shape), len(frames_list[0]) - 1)
+        frames = stack_clips(frames_list, dataset.spatial_transform, dataset.cnn_dim)
+
+        target = sample
+        if dataset.target_transform is not None:
+            target = dataset.target_transform(target)
+        return frames, torch.from_numpy(positions), target
+
+    def __len__(self):
+        return len(self.dataset.data)
+
+
+def video_collate(batch):
+    """collate_fn of the DataLoader of a DenseClipDataset, with batch_size=1: the videos have different numbers
+    of frames and clips, so they are returned one at a time."""
+    assert len(batch) == 1, 'the videos of a DenseClipDataset are loaded one at a time'
+    return batch[0]
+
+
+def expand_clips(frames, positions, time_dim):
+    """
+    Returns the (n_clips x M x C x T x H x W) clips of a video ((n_clips x M x T x C x H x W) for the 2D CNNs)
+    from the buffer of its frames. The clips are views of the buffer when their frames are evenly spaced in it
+    (sliding windows), and are gathered otherwise (e.g. looped clips of the short videos).
+    Args:
+        frames (Tensor): Buffer of the frames, as returned by DenseClipDataset.
+        positions (Tensor): (n_clips x T) positions of the frames of each clip in the buffer.
+        time_dim (int): Dimension of the frames in the buffer (2 for the 3D CNNs, 1 for the 2D CNNs).
+    """
+    n_clips, length = positions.shape
+    positions = positions.to(torch.int64)
+    first = int(positions[0, 0])
+    step = int(positions[0, 1] - first) if length > 1 else 1
+    stride = int(positions[1, 0] - first) if n_clips > 1 else 0
+    expected = first + stride * torch.arange(n_clips).unsqueeze(1) + step * torch.arange(length).unsqueeze(0)
+    if step > 0 and stride >= 0 and torch.equal(positions.cpu(), expected):
+        size = list(frames.shape)
+        size[time_dim] = length
+        strides = list(frames.stride())
+        time_stride = strides[time_dim]
+        strides[time_dim] = time_stride * step
+        return frames.as_strided([n_clips] + size, [time_stride * stride] + strides,
+                                 frames.storage_offset() + first * time_stride)
+    clips = frames.index_select(time_dim, positions.view(-1).to(frames.device))
+    return clips.unflatten(time_dim, (n_clips, length)).movedim(time_dim, 0)
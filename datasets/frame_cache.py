@@ -0,0 +1,143 @@
+'''
+Memory-mapped cache of decoded frames.
+
+Validation and test frames are decoded and scaled to (sample_size x sample_size) in the same way at every epoch,
+so they are decoded once and stored in a uint8 array of shape (N_frames x sample_size x sample_size x 3),
+one for each split and modality:
+
+|- <cache_dir>/<subset>_<modality>_<sample_size>_<key>.npy     frames of all the videos, back to back
+|- <cache_dir>/<subset>_<modality>_<sample_size>_<key>.json    stamp of the cache, and for each video path:
+                                                                [first row, first frame id, number of frames]
+
+The key is a hash of the annotation file and of the root path, so that the datasets sharing a cache directory
+have separate caches.
+
+The array is opened with np.load(mmap_mode='r'), so the DataLoader workers share its pages through the page cache.
+The cache is built again when its stamp changes: the frame ranges of the videos, the size and interpolation of the
+frames, or the size and mtime of the video sources (frame folders, packs or containers), as the sample index.
+'''
+
+import os
+import json
+import hashlib
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+from datasets.frame_store import get_pack_path
+from datasets.video_container import get_container_path
+from datasets.sample_index import files_stamp
+
+
+CACHE_VERSION = 2
+
+
+def get_video_ranges(dataset, modality):
+    """
+    Returns, for each video of the modality, the (first, last) frame ids used by the samples of the dataset.
+    """
+    video_ranges = dict()
+    for sample in dataset:
+        if modality not in sample['videos'] or len(sample['frame_indices']) == 0:
+            continue
+        path = sample['videos'][modality]
+        first, last = int(np.min(sample['frame_indices'])), int(np.max(sample['frame_indices']))
+        if path in video_ranges:
+            first = min(first, video_ranges[path][0])
+            last = max(last, video_ranges[path][1])
+        video_ranges[path] = (first, last)
+    return video_ranges
+
+
+class FrameCache(object):
+    """
+    Video loader reading the decoded frames from the cache, with the same interface of video_loader.
+    Args:
+        cache_dir (string): Directory of the cache files.
+        annotation_path (string): Annotation file of the dataset.
+        root_path (string): Root path of the videos of the dataset.
+        subset (string): Split of the dataset (training | validation | testing).
+        modality (string): Modality of the frames.
+        sample_size (int): Height and width of the cached frames.
+        interpolation (int, optional): Interpolation used to scale the frames, as in spatial_transforms.Scale.
+    """
+
+    def __init__(self, cache_dir, annotation_path, root_path, subset, modality, sample_size, interpolation=Image.BILINEAR):
+        key = json.dumps([os.path.abspath(annotation_path), os.path.abspath(root_path)])
+        key = '{}_{}_{}_{}'.format(subset, modality, sample_size, hashlib.md5(key.encode('utf-8')).hexdigest()[:12])
+        self.array_path = os.path.join(cache_dir, key + '.npy')
+        self.index_path = os.path.join(cache_dir, key + '.json')
+        self.sample_size = sample_size
+        self.interpolation = interpolation
+        self.videos = dict()
+        self.stamp = None
+        self.frames = None
+        if os.path.exists(self.array_path) and os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as index_file:
+                index = json.load(index_file)
+            if isinstance(index, dict) and 'stamp' in index:
+                self.stamp, self.videos = index['stamp'], index['videos']
+
+    def get_stamp(self, video_ranges):
+        sources = [source for path in sorted(video_ranges)
+                   for source in (path, get_pack_path(path), get_container_path(path))]
+        stamp = {
+            'version': CACHE_VERSION,
+            'sample_size': self.sample_size,
+            'interpolation': int(self.interpolation),
+            'ranges': {path: list(video_range) for path, video_range in video_ranges.items()},
+            'sources': files_stamp(sources),
+        }
+        return json.loads(json.dumps(stamp))    # as read back from the json file
+
+    def prepare(self, dataset, modality, loader):
+        """
+        Builds the cache with the given video loader, unless it was built for the same frames of the same videos.
+        """
+        video_ranges = get_video_ranges(dataset, modality)
+        stamp = self.get_stamp(video_ranges)
+        if stamp == self.stamp:
+            return
+
+        n_rows = sum(last - first + 1 for first, last in video_ranges.values())
+        os.makedirs(os.path.dirname(self.array_path) or '.', exist_ok=True)
+        tmp_path = self.array_path + '.tmp.npy'
+        frames = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                           shape=(n_rows, self.sample_size, self.sample_size, 3))
+        videos = dict()
+        row = 0
+        data_iter = tqdm(video_ranges.items(), '{} caching'.format(os.path.basename(self.array_path)), total=len(video_ranges))
+        for path, (first, last) in data_iter:
+            clip = loader(path, list(range(first, last + 1)), None)
+            for i, img in enumerate(clip):
+                if isinstance(img, np.ndarray):
+                    img = Image.fromarray(img)  # frames of the container loader
+                img = img.resize((self.sample_size, self.sample_size), self.interpolation)
+                frames[row + i] = np.asarray(img.convert('RGB'))
+            videos[path] = [row, first, len(clip)]
+            row += last - first + 1
+        frames.flush()
+        del frames
+
+        os.replace(tmp_path, self.array_path)
+        with open(self.index_path, 'w') as index_file:
+            json.dump({'stamp': stamp, 'videos': videos}, index_file)
+        self.videos = videos
+        self.stamp = stamp
+        self.frames = None
+
+    def __call__(self, video_path, frame_indices, sample_duration):
+        if self.frames is None:
+            # opened lazily, so that each DataLoader worker maps the file by itself
+            self.frames = np.load(self.array_path, mmap_mode='r')
+        first_row, first_id, n_frames = self.videos[video_path]
+        offsets = np.asarray(frame_indices, dtype=np.int64) - first_id
+        missing = np.flatnonzero((offsets < 0) | (offsets >= n_frames))
+        if len(missing) > 0:
+            offsets = offsets[:missing[0]]      # stop at the first missing frame, as video_loader
+        return list(self.frames[first_row + offsets])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['frames'] = None
+        return state
@@ -0,0 +1,143 @@
+'''
+Packed frame store.
+
+Every folder of frames (e.g. RGB-D_frames/class_01/subject1_r0/sk_color) is stored as a single
+file, placed next to the folder with the ".pack" extension (RGB-D_frames/class_01/subject1_r0/sk_color.pack).
+The file contains the encoded frames back to back, preceded by an offset index:
+
+|- header   magic (4 bytes), version (uint32), number of frames (uint32)
+|- index    one row for each frame: frame id (uint32), offset (uint64), length (uint32)
+|- data     encoded frames (JPEG bytes as they were on disk)
+
+Reading a clip costs one open and two reads (index and the byte range covering the requested frames),
+instead of one exists-check and one open for each frame.
+The packs are created from the frame trees with utils/pack_frames.py.
+'''
+
+import os
+import io
+import json
+import functools
+import numpy as np
+from PIL import Image
+
+from utils import load_value_file
+
+
+FRAME_COUNTS_NAME = 'n_frames.json'     # written in the dataset folder by utils/n_frames.py
+PACK_EXT = '.pack'
+PACK_MAGIC = b'GRFP'
+PACK_VERSION = 1
+HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u4'), ('n_frames', '<u4')])
+INDEX_DTYPE = np.dtype([('frame_id', '<u4'), ('offset', '<u8'), ('length', '<u4')])
+
+
+def get_pack_path(video_dir_path):
+    return video_dir_path.rstrip(os.sep) + PACK_EXT
+
+
+def write_pack(pack_path, frames):
+    """
+    Args:
+        pack_path (string): Destination file.
+        frames (list): List of (frame_id, encoded_bytes) tuples.
+    """
+    frames = sorted(frames, key=lambda frame: frame[0])
+    index = np.zeros(len(frames), dtype=INDEX_DTYPE)
+    offset = HEADER_DTYPE.itemsize + INDEX_DTYPE.itemsize * len(frames)
+    for i, (frame_id, data) in enumerate(frames):
+        index[i] = (frame_id, offset, len(data))
+        offset += len(data)
+
+    header = np.array([(PACK_MAGIC, PACK_VERSION, len(frames))], dtype=HEADER_DTYPE)
+    tmp_path = pack_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(index.tobytes())
+        for _, data in frames:
+            f.write(data)
+    os.replace(tmp_path, pack_path)     # a crash never leaves a truncated pack behind
+
+
+def _read_index(f):
+    header = np.frombuffer(f.read(HEADER_DTYPE.itemsize), dtype=HEADER_DTYPE)
+    if len(header) != 1 or header['magic'][0] != PACK_MAGIC or header['version'][0] != PACK_VERSION:
+        raise IOError('{} is not a frame pack'.format(f.name))
+    n_frames = int(header['n_frames'][0])
+    return np.frombuffer(f.read(INDEX_DTYPE.itemsize * n_frames), dtype=INDEX_DTYPE)
+
+
+@functools.lru_cache(maxsize=4096)
+def read_pack_index(pack_path):
+    # the index is small (16 bytes for each frame), cache it to avoid reading it at every clip
+    with open(pack_path, 'rb') as f:
+        return _read_index(f)
+
+
+def read_pack_frames(pack_path, frame_indices):
+    """
+    Returns the encoded bytes of the requested frames, stopping at the first missing frame
+    (same behaviour of the folder-based video_loader).
+    """
+    index = read_pack_index(pack_path)
+    if len(index) == 0:
+        return []
+    frame_indices = np.asarray(frame_indices, dtype=np.int64)
+    rows = np.searchsorted(index['frame_id'], frame_indices).clip(0, len(index) - 1)
+    missing = np.flatnonzero(index['frame_id'][rows] != frame_indices)
+    if len(missing) > 0:
+        rows = rows[:missing[0]]
+    if len(rows) == 0:
+        return []
+
+    offsets = index['offset'][rows].astype(np.int64)
+    lengths = index['length'][rows].astype(np.int64)
+    begin = int(offsets.min())
+    end = int((offsets + lengths).max())
+    with open(pack_path, 'rb') as f:
+        f.seek(begin)
+        buffer = f.read(end - begin)        # frames of a clip are contiguous: read them at once
+
+    view = memoryview(buffer)
+    return [view[o - begin:o - begin + l] for o, l in zip(offsets, lengths)]
+
+
+def pil_bytes_loader(data, draft_size=None):
+    with Image.open(io.BytesIO(data)) as img:
+        if draft_size is not None:
+            img.draft('RGB', draft_size)
+        return img.convert('RGB')
+
+
+def packed_video_loader(video_dir_path, frame_indices, sample_duration, image_loader):
+    return [image_loader(data) for data in read_pack_frames(get_pack_path(video_dir_path), frame_indices)]
+
+
+def get_packed_video_loader(draft_size=None):
+    image_loader = functools.partial(pil_bytes_loader, draft_size=draft_size)
+    return functools.partial(packed_video_loader, image_loader=image_loader)
+
+
+def video_exists(video_dir_path, frame_store='jpeg'):
+    if frame_store == 'packed':
+        return os.path.exists(get_pack_path(video_dir_path))
+    return os.path.exists(video_dir_path)
+
+
+def load_n_frames(video_dir_path, frame_store='jpeg'):
+    if frame_store == 'packed':
+        index = read_pack_index(get_pack_path(video_dir_path))
+        return int(index['frame_id'][-1]) if len(index) > 0 else 0
+    return int(load_value_file(os.path.join(video_dir_path, 'n_frames')))
+
+
+def load_frame_counts(root_path):
+    """
+    Returns the number of frames of each modality of each video ({video: {modality: n_frames}}) from the index
+    written by utils/n_frames.py, None if the dataset has no index.
+    """
+    counts_path = os.path.join(root_path, FRAME_COUNTS_NAME)
+    if not os.path.exists(counts_path):
+        return None
+    with open(counts_path, 'r') as counts_file:
+        return json.load(counts_file)['videos']
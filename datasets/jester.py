@@ -12,28 +12,36 @@ import random
 from tqdm import tqdm
 
 from utils import load_value_file
+from datasets.frame_cache import FrameCache
+from datasets.clip_reader import MultiModalReader, stack_clips, get_prefetching_video_loader
+from datasets.frame_store import get_packed_video_loader, video_exists, load_n_frames, load_frame_counts, FRAME_COUNTS_NAME
+from datasets.sample_index import load_sample_index, sliding_windows, SampleTable
 
 
-def pil_loader(path):
+def pil_loader(path, draft_size=None):
     # open path as file to avoid ResourceWarning (https://github.com/python-pillow/Pillow/issues/835)
     with open(path, 'rb') as f:
         with Image.open(f) as img:
+            if draft_size is not None:
+                img.draft('RGB', draft_size)    # JPEG decoded at the smallest 1/2, 1/4, 1/8 scale not below draft_size
             return img.convert('RGB')
 
 
-def accimage_loader(path):
+def accimage_loader(path, draft_size=None):
     try:
         import accimage
         return accimage.Image(path)
     except IOError:
         # Potentially a decoding problem, fall back to PIL.Image
-        return pil_loader(path)
+        return pil_loader(path, draft_size)
 
 
-def get_default_image_loader():
+def get_default_image_loader(draft_size=None):
     from torchvision import get_image_backend
     if get_image_backend() == 'accimage':
         return accimage_loader
+    elif draft_size is not None:
+        return functools.partial(pil_loader, draft_size=draft_size)
     else:
         return pil_loader
 
@@ -50,8 +58,8 @@ def video_loader(video_dir_path, frame_indices, sample_duration, image_loader):
     return video
 
 
-def get_default_video_loader():
-    image_loader = get_default_image_loader()
+def get_default_video_loader(draft_size=None):
+    image_loader = get_default_image_loader(draft_size)
     return functools.partial(video_loader, image_loader=image_loader)
 
 
@@ -84,16 +92,12 @@ def get_video_names_and_annotations(data, subset):
     return video_names, annotations
 
 
-def make_dataset(root_path, annotation_path, modalities, subset, n_samples_for_each_video, sample_duration):
-    data = load_annotation_data(annotation_path)
+def compile_samples(data, root_path, modalities, subset, frame_store='jpeg'):
     video_names, annotations = get_video_names_and_annotations(data, subset)
     class_to_idx = get_class_labels(data)
-    idx_to_class = {}
-    for name, label in class_to_idx.items():
-        idx_to_class[label] = name
+    frame_counts = load_frame_counts(root_path)
 
-    datasets = dict()
-    dataset = []
+    samples = list()
     data_iter = tqdm(range(len(video_names)), '{} set loading'.format(subset), total=len(video_names))
     for i in data_iter:
         '''
@@ -112,7 +116,7 @@ def make_dataset(root_path, annotation_path, modalities, subset, n_samples_for_e
                 mod_folder = 'MHI_frames'
             
             video_path = os.path.join(root_path, mod_folder, video_names[i])
-            if not os.path.exists(video_path):
+            if not video_exists(video_path, frame_store):
                 print(video_path)
                 continue
             video_paths[modality] = video_path
@@ -124,8 +128,12 @@ def make_dataset(root_path, annotation_path, modalities, subset, n_samples_for_e
         '''
         
         # work if the different modalities are sinchronized on the frame, also a list of indices have to be built
-        n_frames_file_path = os.path.join(video_path, 'n_frames')
-        n_frames = int(load_value_file(n_frames_file_path))
+        if frame_counts is not None and all(modality in frame_counts.get(video_names[i], ()) for modality in modalities):
+            # frames available in all the modalities, from the index written by utils/n_frames.py
+            n_frames = min(frame_counts[video_names[i]][modality] for modality in modalities)
+        else:
+            # no index, or a video missing from it (e.g. extracted after it was written)
+            n_frames = load_n_frames(video_path, frame_store)
         if n_frames <= 0:
             continue
 
@@ -134,6 +142,7 @@ def make_dataset(root_path, annotation_path, modalities, subset, n_samples_for_e
         sample = {
             'videos': video_paths,
             'segment': [begin_t, end_t],
+            'frames': [1, n_frames + 1],
             'n_frames': n_frames,
             # 'video_id': video_names[i].split('/')[1]
             'video_id': video_names[i]
@@ -142,37 +151,56 @@ def make_dataset(root_path, annotation_path, modalities, subset, n_samples_for_e
             sample['label'] = class_to_idx[annotations[i]['label']]
         else:
             sample['label'] = -1
+        samples.append(sample)
 
-        if n_samples_for_each_video == 1:
-            sample['frame_indices'] = list(range(1, n_frames + 1))
-            dataset.append(sample)
-        else:
-            if n_samples_for_each_video > 1:
-                step = max(1,
-                           math.ceil((n_frames - 1 - sample_duration) /
-                                     (n_samples_for_each_video - 1)))
-            else:
-                step = sample_duration
-            for j in range(1, n_frames, step):
-                sample_j = copy.deepcopy(sample)
-                sample_j['frame_indices'] = list(
-                    range(j, min(n_frames + 1, j + sample_duration)))
-                dataset.append(sample_j)
+    return samples
 
-    return dataset, idx_to_class
+
+def make_dataset(root_path, annotation_path, modalities, subset, n_samples_for_each_video, sample_duration, frame_store='jpeg', index_dir=None):
+    # the annotation file is parsed and the videos are checked only when the index is compiled (see datasets/sample_index.py)
+    index = load_sample_index(annotation_path, subset, modalities, root_path, frame_store,
+                              functools.partial(compile_samples, root_path=root_path, modalities=modalities,
+                                                subset=subset, frame_store=frame_store),
+                              sources=[os.path.join(root_path, FRAME_COUNTS_NAME)], index_dir=index_dir)
+    idx_to_class = {}
+    for label, name in enumerate(index.labels):
+        idx_to_class[label] = name
+
+    n_frames = np.asarray(index.column('n_frames'))
+    if n_samples_for_each_video == 1:
+        return SampleTable(index, np.arange(len(index)), np.ones_like(n_frames), n_frames + 1), idx_to_class
+
+    if n_samples_for_each_video > 1:
+        step = np.maximum(1, np.ceil((n_frames - 1 - sample_duration) / (n_samples_for_each_video - 1)))
+    else:
+        step = np.full(len(index), sample_duration)
+    rows, begin, end = sliding_windows(np.ones_like(n_frames), n_frames, n_frames + 1, step, sample_duration)
+    return SampleTable(index, rows, begin, end), idx_to_class
 
 
 class Jester(data.Dataset):
     """
     Args:
         root (string): Root directory path.
-        spatial_transform (callable, optional): A function/transform that  takes in an PIL image
-            and returns a transformed version. E.g, ``transforms.RandomCrop``
+        spatial_transform (callable, optional): A function/transform that  takes in the list of frames of a clip
+            and returns the transformed clip as a (T x C x H x W) tensor. E.g, ``spatial_transforms.Compose``
         temporal_transform (callable, optional): A function/transform that  takes in a list of frame indices
             and returns a transformed version
         target_transform (callable, optional): A function/transform that takes in the
             target and transforms it.
         loader (callable, optional): A function to load an video given its path and frame indices.
+        frame_store (string, optional): Storage format of the frames, 'jpeg' (one file for each frame)
+            or 'packed' (one file for each video, see datasets/frame_store.py).
+        frame_cache (string, optional): Directory of the memory-mapped cache of the frames decoded and scaled
+            to (sample_size x sample_size), see datasets/frame_cache.py. If None, the frames are decoded at each access.
+        sample_size (int, optional): Height and width of the cached frames.
+        io_threads (int, optional): Threads of each process reading and decoding the frames of a clip
+            (see datasets/clip_reader.py). If 0, the frames are read one after the other by the loader.
+        max_inflight_frames (int, optional): Maximum number of frames submitted to the I/O threads at a time.
+        jpeg_draft (bool, optional): If true, the JPEG frames are decoded at a reduced resolution when the spatial
+            transform scales them down anyway (see spatial_transforms.Compose.draft_size).
+        index_dir (string, optional): Directory of the compiled sample indexes (see datasets/sample_index.py),
+            sample_index.DEFAULT_INDEX_DIR if None.
      Attributes:
         classes (list): List of the class names.
         class_to_idx (dict): Dict with items (class_name, class_index).
@@ -190,20 +218,40 @@ class Jester(data.Dataset):
                  target_transform=None,
                  sample_duration=16,
                  get_loader=get_default_video_loader,
-                 cnn_dim=3):
+                 cnn_dim=3,
+                 frame_store='jpeg',
+                 frame_cache=None,
+                 sample_size=112,
+                 io_threads=0,
+                 max_inflight_frames=32,
+                 jpeg_draft=False,
+                 index_dir=None):
         self.data, self.class_names = make_dataset(root_path,
         annotation_path,
         modalities,
         subset,
         n_samples_for_each_video,
-        sample_duration)
+        sample_duration,
+        frame_store,
+        index_dir)
         
         self.modalities = modalities
         self.spatial_transform = spatial_transform
         self.temporal_transform = temporal_transform
         self.target_transform = target_transform
         self.sample_duration = sample_duration
-        self.loader = get_loader()
+        draft_size = getattr(spatial_transform, 'draft_size', None) if jpeg_draft else None
+        if io_threads > 0:
+            self.loader = get_prefetching_video_loader(frame_store, get_default_image_loader(draft_size), '{:05d}.jpg',
+                                                       io_threads, max_inflight_frames, draft_size)
+        else:
+            self.loader = get_packed_video_loader(draft_size) if frame_store == 'packed' else get_loader(draft_size)
+        self.cache_loaders = dict()
+        if frame_cache:
+            for modality in self.modalities:
+                self.cache_loaders[modality] = FrameCache(frame_cache, annotation_path, root_path, subset, modality, sample_size)
+                self.cache_loaders[modality].prepare(self.data, modality, self.loader)
+        self.reader = MultiModalReader(len(self.modalities))
         self.cnn_dim = cnn_dim
 
     def __getitem__(self, index):
@@ -214,31 +262,17 @@ class Jester(data.Dataset):
             tuple: (image, target) where target is class_index of the target class.
         """
         
-        frame_indices = self.data[index]['frame_indices']
+        sample = self.data[index]      # built on access from the sample table
+        frame_indices = sample['frame_indices']
         if self.temporal_transform is not None:
             frame_indices = self.temporal_transform(frame_indices)
         
-        clips_list = list()
-        for modality in self.modalities:
-            path = self.data[index]['videos'][modality]
-            # print('PATH: {}\tMODALITY: {}\tFRAME INDICES: {}\tSAMPLE DURATION: {}\n'.format(path, modality, frame_indices, self.sample_duration))
-            # clip = self.loader(path, frame_indices)
-            clip = self.loader(path, frame_indices, self.sample_duration)
-            if self.spatial_transform is not None:
-                self.spatial_transform.randomize_parameters()
-                clip = [self.spatial_transform(img) for img in clip]
-            # im_dim = clip[0].size()[-2:]
-            if self.cnn_dim == 3:
-                clip = torch.stack(clip, 0).permute(1, 0, 2, 3)
-            else:
-                clip = torch.stack(clip, 0)
-            # print('clip shape: {}'.format(clip.shape))
-            
-            clips_list.append(clip)
-        
-        clips = torch.stack(clips_list, 0)  # trasform in a tensor
+        # the modalities are read together and written in a single (M x C x T x H x W) tensor
+        reads = [(self.cache_loaders.get(modality, self.loader), sample['videos'][modality]) for modality in self.modalities]
+        clips_list = self.reader(reads, frame_indices, self.sample_duration)
+        clips = stack_clips(clips_list, self.spatial_transform, self.cnn_dim)
             
-        target = self.data[index]
+        target = sample
         if self.target_transform is not None:
             target = self.target_transform(target)
             
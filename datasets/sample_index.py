@@ -0,0 +1,231 @@
+'''
+Compiled sample index.
+
+Parsing the annotation json and checking the frame folders of every video takes minutes on the augmented
+annotation files, so it is done once for each (annotation file, subset, modalities, root path, frame store)
+and the result is stored as columns of fixed-size arrays, one row for each video, in a cache directory outside
+the repository (--index_dir, ~/.cache/gesture_recognition/sample_index by default, so that the annotation
+directories can be read-only):
+
+|- <index_dir>/<annotation file name>_<subset>_<key>/
+|--- meta.json        class labels, modalities, number of videos and size/mtime of the files the index was compiled from
+|--- video_ids.npy    video id (bytes)
+|--- paths.npy        table of the distinct video paths (bytes)
+|--- path_ids.npy     (N_videos x N_modalities) row of paths.npy of each modality, -1 if the video is missing
+|--- segment.npy      (N_videos x 2) annotated segment
+|--- frames.npy       (N_videos x 2) first and last+1 frame ids of the video
+|--- n_frames.npy     number of frames
+|--- label.npy        class index, -1 if the subset is not annotated
+|--- views.npy        augmentation view of the video (bytes, see datasets/augmentation_views.py), empty if not augmented
+
+The arrays are opened with np.load(mmap_mode='r'): opening an index costs the same whatever its size, and the
+DataLoader workers share its pages instead of holding one copy of the samples each.
+The index is compiled again when the annotation file (or the n_frames.json index of the frames) changes.
+'''
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+
+INDEX_VERSION = 2
+COLUMNS = ['video_ids', 'paths', 'path_ids', 'segment', 'frames', 'n_frames', 'label', 'views']
+DEFAULT_INDEX_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                                 'gesture_recognition', 'sample_index')
+
+
+def get_index_dir(annotation_path, subset, modalities, root_path, frame_store, index_dir=None):
+    key = json.dumps([os.path.abspath(annotation_path), os.path.abspath(root_path), list(modalities), frame_store])
+    key = hashlib.md5(key.encode('utf-8')).hexdigest()[:12]
+    name = '{}_{}_{}'.format(os.path.basename(annotation_path), subset, key)
+    return os.path.join(index_dir or DEFAULT_INDEX_DIR, name)
+
+
+def files_stamp(paths):
+    """[path, size, mtime] of each existing path, to detect when the files a cache was built from change."""
+    stamp = []
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stamp.append([path, stat.st_size, stat.st_mtime_ns])
+    return stamp
+
+
+def _to_bytes(strings):
+    strings = [s.encode('utf-8') for s in strings]
+    return np.array(strings, dtype='S{}'.format(max([len(s) for s in strings] + [1])))
+
+
+def write_sample_index(index_dir, samples, labels, modalities, stamp):
+    """
+    Args:
+        index_dir (string): Destination directory.
+        samples (list): One dict for each video, with keys 'video_id', 'videos' (path of each available modality),
+            'segment', 'frames' (first and last+1 frame ids), 'n_frames', 'label' and optionally 'view'.
+        labels (list): Class labels of the annotation file.
+        modalities (list): Modalities of the index, in the order of the columns of path_ids.
+        stamp (list): Size and mtime of the annotation file and of the other files the samples were compiled from.
+    """
+    paths = dict()
+    path_ids = np.full((len(samples), len(modalities)), -1, dtype=np.int32)
+    for i, sample in enumerate(samples):
+        for j, modality in enumerate(modalities):
+            if modality in sample['videos']:
+                path_ids[i, j] = paths.setdefault(sample['videos'][modality], len(paths))
+
+    columns = {
+        'video_ids': _to_bytes([sample['video_id'] for sample in samples]),
+        'paths': _to_bytes(sorted(paths, key=paths.get)),
+        'path_ids': path_ids,
+        'segment': np.array([sample['segment'] for sample in samples], dtype=np.int32).reshape(-1, 2),
+        'frames': np.array([sample['frames'] for sample in samples], dtype=np.int32).reshape(-1, 2),
+        'n_frames': np.array([sample['n_frames'] for sample in samples], dtype=np.int32),
+        'label': np.array([sample['label'] for sample in samples], dtype=np.int32),
+        'views': _to_bytes([sample.get('view', '') for sample in samples]),
+    }
+    meta = {'version': INDEX_VERSION, 'stamp': stamp, 'labels': labels, 'modalities': list(modalities), 'length': len(samples)}
+
+    tmp_dir = index_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, column in columns.items():
+        np.save(os.path.join(tmp_dir, name + '.npy'), column)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as meta_file:
+        json.dump(meta, meta_file)
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)      # a crash never leaves a partial index behind
+
+
+def read_index_meta(index_dir):
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r') as meta_file:
+        return json.load(meta_file)
+
+
+class SampleIndex(object):
+    """
+    Read-only view of a compiled index.
+    Args:
+        index_dir (string): Directory of the index.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        meta = read_index_meta(index_dir)
+        self.labels = meta['labels']
+        self.modalities = meta['modalities']
+        self.length = meta['length']
+        self.columns = None
+
+    def column(self, name):
+        if self.columns is None:
+            # opened lazily, so that each DataLoader worker maps the files by itself
+            self.columns = dict()
+            for column in COLUMNS:
+                self.columns[column] = np.load(os.path.join(self.index_dir, column + '.npy'), mmap_mode='r')
+        return self.columns[name]
+
+    def __len__(self):
+        return self.length
+
+    def get_video(self, row):
+        """
+        Returns the video of the row as the dicts built by make_dataset ('videos', 'segment', 'n_frames', 'video_id', 'label', 'view').
+        """
+        paths = self.column('paths')
+        videos = dict()
+        for modality, path_id in zip(self.modalities, self.column('path_ids')[row]):
+            if path_id >= 0:
+                videos[modality] = paths[path_id].decode('utf-8')
+        return {
+            'videos': videos,
+            'segment': [int(t) for t in self.column('segment')[row]],
+            'n_frames': int(self.column('n_frames')[row]),
+            'video_id': self.column('video_ids')[row].decode('utf-8'),
+            'label': int(self.column('label')[row]),
+            'view': self.column('views')[row].decode('utf-8'),
+        }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['columns'] = None
+        return state
+
+
+def sliding_windows(first, last, limit, step, sample_duration):
+    """
+    Splits each video in windows starting at range(first, last, step) and ending at min(limit, start + sample_duration),
+    with one value of each argument (except sample_duration) for each video.
+    Returns:
+        (rows, begin, end) arrays, with the video and the first and last+1 frame ids of each window.
+    """
+    first, last, limit, step = [np.asarray(a, dtype=np.int64) for a in (first, last, limit, step)]
+    n_windows = np.maximum(0, -((first - last) // step))   # len(range(first, last, step))
+    rows = np.repeat(np.arange(len(first)), n_windows)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(n_windows) - n_windows, n_windows)
+    begin = first[rows] + offsets * step[rows]
+    end = np.minimum(limit[rows], begin + sample_duration)
+    return rows, begin, end
+
+
+class SampleTable(object):
+    """
+    Samples of a dataset as columns of int32 arrays (video row in the index, first and last+1 frame ids, label),
+    instead of one dict for each sample: the table is a handful of arrays whatever the number of samples,
+    so the DataLoader workers do not copy it page by page as they touch the reference counts of the dicts.
+    The samples are returned as dicts built on access, with the same keys of the ones built by make_dataset.
+    Args:
+        index (SampleIndex): Compiled index of the videos.
+        rows (array): Row of the video of each sample in the index.
+        begin (array): First frame id of each sample.
+        end (array): Last+1 frame id of each sample.
+    """
+
+    def __init__(self, index, rows, begin, end):
+        self.index = index
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.begin = np.asarray(begin, dtype=np.int32)
+        self.end = np.asarray(end, dtype=np.int32)
+        self.label = np.asarray(index.column('label'))[self.rows]
+
+    def frame_indices(self, index):
+        return np.arange(self.begin[index], self.end[index])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('sample index out of range')
+        sample = self.index.get_video(self.rows[index])
+        sample['frame_indices'] = self.frame_indices(index)
+        return sample
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def load_sample_index(annotation_path, subset, modalities, root_path, frame_store, compile_samples, sources=(), index_dir=None):
+    """
+    Opens the compiled index of the subset, compiling it first if it is missing or older than the annotation file.
+    Args:
+        compile_samples (callable): Function taking the annotation data and returning the list of samples
+            to store (see write_sample_index), called only when the index is compiled.
+        sources (sequence, optional): Other files read by compile_samples, the index is compiled again when they change.
+        index_dir (string, optional): Directory of the compiled indexes, DEFAULT_INDEX_DIR if None.
+    """
+    index_dir = get_index_dir(annotation_path, subset, modalities, root_path, frame_store, index_dir)
+    stamp = files_stamp([annotation_path] + list(sources))
+    meta = read_index_meta(index_dir)
+    if meta is None or meta['version'] != INDEX_VERSION or meta['stamp'] != stamp:
+        with open(annotation_path, 'r') as data_file:
+            data = json.load(data_file)
+        write_sample_index(index_dir, compile_samples(data), data['labels'], modalities, stamp)
+    return SampleIndex(index_dir)
@@ -0,0 +1,138 @@
+'''
+Direct decoding of the frames from the recorded videos (--video_backend container), instead of the frame trees
+extracted by utils/video_jpg_chalearn_isogd.py.
+
+Only the frames requested by the temporal transform are decoded: the decoder seeks to the keyframe preceding
+each requested frame, unless the frame can be reached by decoding forward from the previous one.
+The positions of the frames are found in a frame index (pts and keyframe flag of every decoded frame, in
+presentation order), built by decoding the file once, and cached in memory and next to the video:
+
+|- <video>.avi
+|- <video>.avi.frames.npy
+
+The index holds the pts of the decoded frames rather than the ones of the packets: with B-frames the packets are
+stored in decoding order and some of them have no pts in AVI files. A seek may also land after the requested
+keyframe (AVI files are seeked by dts), so the first decoded frame is checked and the decoder seeks to an earlier
+keyframe when it is past the requested frame.
+
+Frame ids are 1-based as the names of the frames extracted by ffmpeg (image_00001.jpg is the first frame).
+Requires PyAV (av).
+'''
+
+import os
+import functools
+import numpy as np
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+CONTAINER_EXT = '.avi'
+FRAME_INDEX_EXT = '.frames.npy'
+FRAME_INDEX_DTYPE = np.dtype([('pts', '<i8'), ('key', '?')])
+
+
+def get_container_path(video_path):
+    return video_path + CONTAINER_EXT
+
+
+def container_exists(video_path):
+    return os.path.exists(get_container_path(video_path))
+
+
+def build_frame_index(container_path):
+    frames = []
+    with av.open(container_path) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        for frame in container.decode(stream):
+            # frames without pts follow the previous one
+            pts = frame.pts if frame.pts is not None else (frames[-1][0] + 1 if frames else 0)
+            frames.append((pts, frame.key_frame))
+    return np.array(sorted(frames), dtype=FRAME_INDEX_DTYPE)
+
+
+@functools.lru_cache(maxsize=4096)
+def read_frame_index(container_path):
+    index_path = container_path + FRAME_INDEX_EXT
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(container_path):
+        return np.load(index_path)
+    index = build_frame_index(container_path)
+    try:
+        tmp_path = index_path + '.tmp.npy'
+        np.save(tmp_path, index)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        pass    # read-only dataset, the index is kept in memory only
+    return index
+
+
+def load_container_n_frames(video_path):
+    return len(read_frame_index(get_container_path(video_path)))
+
+
+def _decode_until(frames, index, target, position):
+    """
+    Decodes the frames up to the target frame number. Returns the number of the last decoded frame (position if
+    none was decoded) and the target frame, None if the decoder went past it or reached the end of the video.
+    """
+    for frame in frames:
+        position = position + 1 if frame.pts is None else int(np.searchsorted(index['pts'], frame.pts))
+        if position >= target:
+            return position, frame if position == target else None
+    return position, None
+
+
+def container_video_loader(video_path, frame_indices, sample_duration):
+    """
+    Video loader with the interface of video_loader, returning the frames as (H x W x 3) uint8 arrays
+    and stopping at the first missing frame.
+    """
+    container_path = get_container_path(video_path)
+    index = read_frame_index(container_path)
+    numbers = np.asarray(frame_indices, dtype=np.int64) - 1
+    missing = np.flatnonzero((numbers < 0) | (numbers >= len(index)))
+    if len(missing) > 0:
+        numbers = numbers[:missing[0]]
+    if len(numbers) == 0:
+        return []
+
+    keyframes = np.flatnonzero(index['key'])
+    decoded = dict()
+    with av.open(container_path) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        frames = None
+        position = -1       # number of the last decoded frame
+        for target in np.unique(numbers):
+            k = np.searchsorted(keyframes, target, side='right') - 1
+            frame, seek = None, True
+            if frames is not None and (k < 0 or keyframes[k] <= position):
+                # decoding forward is cheaper than seeking back to the keyframe
+                position, frame = _decode_until(frames, index, target, position)
+                seek = frame is None and position > target
+            if seek:
+                # the keyframe, then the previous ones and the beginning of the video while the seek lands after it
+                for keyframe in list(keyframes[k::-1] if k >= 0 else []) + [None]:
+                    if keyframe is None:
+                        container.seek(0)
+                        position = -1
+                    else:
+                        container.seek(int(index['pts'][keyframe]), stream=stream)
+                        position = keyframe - 1
+                    frames = container.decode(stream)
+                    position, frame = _decode_until(frames, index, target, position)
+                    if position <= target:
+                        break
+            if frame is None:
+                break
+            decoded[target] = frame.to_ndarray(format='rgb24')
+
+    video = []
+    for number in numbers:
+        if number not in decoded:
+            break
+        video.append(decoded[number])
+    return video
@@ -17,7 +17,9 @@ from temporal_transforms import *
 from target_transforms import ClassLabel, VideoID
 from target_transforms import Compose as TargetCompose
 from dataset import get_training_set, get_validation_set, get_test_set
+from datasets.dense_clips import DenseClipDataset, video_collate
 from utils import *
+from random_state import seed_all, worker_init_fn
 from train import train_epoch, train_epoch_custom_loss
 from validation import val_epoch
 import test
@@ -53,7 +55,8 @@ if __name__ == '__main__':
     with open(os.path.join(opt.result_path, 'opts_{}_{}_{}_{}.json'.format(opt.dataset, opt.model, '_'.join([modality for modality in opt.modalities]), aggrs)), 'w') as opt_file:
         json.dump(vars(opt), opt_file)
 
-    torch.manual_seed(opt.manual_seed)
+    # the transforms of the workers are seeded by worker_init_fn from the seed of the main process
+    seed_all(opt.manual_seed)
     
     input_shape = (opt.batch_size, len(opt.modalities), 3, opt.sample_duration, opt.sample_size, opt.sample_size)
     if opt.cnn_dim == 3:
@@ -91,6 +94,25 @@ if __name__ == '__main__':
         norm_method = Normalize(opt.mean, [1, 1, 1])
     else:
         norm_method = Normalize(opt.mean, opt.std)
+    # ToTensor and Normalize in a single stage, writing the clips directly in the layout of the model
+    clip_layout = 'CTHW' if opt.cnn_dim == 3 else 'TCHW'
+    train_device_transform = None
+    eval_device_transform = None
+    if opt.device_transforms:
+        # the workers return uint8 clips (rotated, resized and cropped in training, as without --device_transforms),
+        # converted and normalized (and brightness jittered and displaced in training) for the whole batch on the device
+        to_tensor_method = ToNormalizedTensor(opt.norm_value, dtype=torch.uint8, layout=clip_layout)
+        device = 'cuda' if opt.gpu is not None else 'cpu'
+        channel_dim = 2 if opt.cnn_dim == 3 else 3
+        batch_norm_method = BatchNormalize(opt.norm_value, norm_method.mean, norm_method.std, channel_dim)
+        # same order as the transforms of the workers: brightness jitter, then elastic displacement of the cropped frames
+        batch_augmentation = [BatchMultiplyValues()]
+        if opt.elastic_displacement:
+            batch_augmentation.append(BatchElasticDisplacement())
+        train_device_transform = BatchCompose(batch_augmentation + [batch_norm_method], device)
+        eval_device_transform = BatchCompose([batch_norm_method], device)
+    else:
+        to_tensor_method = ToNormalizedTensor(opt.norm_value, norm_method.mean, norm_method.std, layout=clip_layout)
 
     if not opt.no_train:
         assert opt.train_crop in ['random', 'corner', 'center', 'none']
@@ -114,12 +136,22 @@ if __name__ == '__main__':
             #SaltImage(),
             #Gaussian_blur(),
             #SpatialElasticDisplacement(),
-            ToTensor(opt.norm_value), norm_method
+            to_tensor_method
         ])
-        temporal_transform = TemporalRandomCrop(opt.sample_duration, opt.downsample)
+        if opt.elastic_displacement:
+            spatial_transform.transforms.insert(-1, SpatialElasticDisplacement())
+        if train_device_transform is not None:
+            # elastic displacement and brightness jitter are applied to the batch by train_device_transform, the rotation
+            # stays in the workers since it is applied to the full frames, before RandomResize and the crop
+            batch_types = (SpatialElasticDisplacement, MultiplyValues)
+            spatial_transform.transforms = [t for t in spatial_transform.transforms if not isinstance(t, batch_types)]
+        if opt.temporal_sampling == 'segment':
+            temporal_transform = TemporalSegmentSampling(opt.sample_duration, random_shift=True)
+        else:
+            temporal_transform = TemporalRandomCrop(opt.sample_duration, opt.downsample)
         target_transform = ClassLabel()
         training_data = get_training_set(opt, spatial_transform, temporal_transform, target_transform)
-        train_loader = torch.utils.data.DataLoader(training_data, batch_size=opt.batch_size, shuffle=True, num_workers=opt.n_threads, pin_memory=True)
+        train_loader = torch.utils.data.DataLoader(training_data, batch_size=opt.batch_size, shuffle=True, num_workers=opt.n_threads, pin_memory=True, worker_init_fn=worker_init_fn)
         train_logger = Logger(
             os.path.join(opt.result_path, 'train{}_{}.log'.format(''.join(['_'+modality for modality in opt.modalities]), aggrs)),
             ['epoch', 'loss', 'prec1', 'prec5', 'lr'])
@@ -137,9 +169,12 @@ if __name__ == '__main__':
         optimizer = None
         scheduler = None
         
+        optimized_params = set()
         for i in range(len(opt.modalities)):
             if opt.SSA_loss:
-                params = model.module.cnns[i].parameters()
+                # the stages shared by the modalities (--shared_layers) are stepped by the optimizer of the first one only
+                params = [param for param in model.module.cnns[i].parameters() if id(param) not in optimized_params]
+                optimized_params.update(id(param) for param in params)
             else:
                 params = model.parameters()
             optimizer = optim.SGD(
@@ -166,13 +201,16 @@ if __name__ == '__main__':
             # Scale_original(opt.sample_size),        # insert by beis
             Scale(opt.sample_size),         # comment by beis
             # CenterCrop(opt.sample_size),  # comment by beis
-            ToTensor(opt.norm_value), norm_method
+            to_tensor_method
         ])
         #temporal_transform = LoopPadding(opt.sample_duration)
-        temporal_transform = TemporalCenterCrop(opt.sample_duration, opt.downsample)
+        if opt.temporal_sampling == 'segment':
+            temporal_transform = TemporalSegmentSampling(opt.sample_duration, random_shift=False)
+        else:
+            temporal_transform = TemporalCenterCrop(opt.sample_duration, opt.downsample)
         target_transform = ClassLabel()
         validation_data = get_validation_set(opt, spatial_transform, temporal_transform, target_transform)
-        val_loader = torch.utils.data.DataLoader(validation_data, batch_size=opt.batch_size, shuffle=False, num_workers=opt.n_threads, pin_memory=True)
+        val_loader = torch.utils.data.DataLoader(validation_data, batch_size=opt.batch_size, shuffle=False, num_workers=opt.n_threads, pin_memory=True, worker_init_fn=worker_init_fn)
         val_log_info = ['epoch', 'loss', 'prec1', 'prec5']
         for modality in opt.modalities:
             val_log_info.append(modality+'_prec1')
@@ -197,7 +235,7 @@ if __name__ == '__main__':
             state = dict()
             # adjust_learning_rate(optimizer, i, opt)
             if opt.SSA_loss:
-                train_epoch_custom_loss(i, train_loader, model, criterion, optimizers, opt, train_logger, train_batch_logger)
+                train_epoch_custom_loss(i, train_loader, model, criterion, optimizers, opt, train_logger, train_batch_logger, train_device_transform)
                 state = {
                     'epoch': i,
                     'arch': opt.arch,
@@ -206,7 +244,7 @@ if __name__ == '__main__':
                     'best_prec1': best_prec1
                     }
             else:
-                train_epoch(i, train_loader, model, criterion, optimizers[0], opt, train_logger, train_batch_logger)
+                train_epoch(i, train_loader, model, criterion, optimizers[0], opt, train_logger, train_batch_logger, train_device_transform)
                 state = {
                     'epoch': i,
                     'arch': opt.arch,
@@ -217,7 +255,7 @@ if __name__ == '__main__':
             save_checkpoint(state, False, opt)
             
         if not opt.no_val:
-            validation_loss, prec1, mods_prec1 = val_epoch(i, val_loader, model, criterion, opt, val_logger)
+            validation_loss, prec1, mods_prec1 = val_epoch(i, val_loader, model, criterion, opt, val_logger, eval_device_transform)
             
             if opt.SSA_loss:
                 for i in range(len(opt.modalities)):
@@ -264,18 +302,41 @@ if __name__ == '__main__':
             Scale(opt.sample_size),
             # CornerCrop(opt.sample_size, opt.crop_position_in_test),
             # CenterCrop(opt.sample_size),
-            ToTensor(opt.norm_value), norm_method
+            to_tensor_method
         ])
         # temporal_transform = LoopPadding(opt.sample_duration, opt.downsample)
         # temporal_transform = TemporalRandomCrop(opt.sample_duration, opt.downsample)
-        temporal_transform = TemporalCenterCrop(opt.sample_duration, opt.downsample)
+        if opt.temporal_sampling == 'segment':
+            temporal_transform = TemporalSegmentSampling(opt.sample_duration, random_shift=False)
+        else:
+            temporal_transform = TemporalCenterCrop(opt.sample_duration, opt.downsample)
         target_transform = VideoID()
 
-        test_data = get_test_set(opt, spatial_transform, temporal_transform, target_transform)
-        test_loader = torch.utils.data.DataLoader(
-            test_data,
-            batch_size=opt.batch_size,
-            shuffle=False,
-            num_workers=opt.n_threads,
-            pin_memory=True)
-        test.test(test_loader, model, opt, test_data.class_names)
\ No newline at end of file
+        if opt.dense_test:
+            # one sample for each video, with the frames of all its windows (or of its dense_test_clips clips)
+            if opt.dense_test_clips > 0:
+                clips_transform = TemporalMultiClip(opt.sample_duration, opt.downsample, opt.dense_test_clips)
+            else:
+                step = opt.dense_test_step or max(1, opt.sample_duration * opt.downsample // 2)
+                clips_transform = TemporalSlidingWindows(opt.sample_duration, opt.downsample, step)
+            test_data = get_test_set(opt, spatial_transform, None, target_transform, n_samples=1)
+            test_data = DenseClipDataset(test_data, clips_transform)
+            test_loader = torch.utils.data.DataLoader(
+                test_data,
+                batch_size=1,
+                shuffle=False,
+                num_workers=opt.n_threads,
+                pin_memory=True,
+                collate_fn=video_collate,
+                worker_init_fn=worker_init_fn)
+            test.test_videos(test_loader, model, opt, test_data.class_names, eval_device_transform)
+        else:
+            test_data = get_test_set(opt, spatial_transform, temporal_transform, target_transform)
+            test_loader = torch.utils.data.DataLoader(
+                test_data,
+                batch_size=opt.batch_size,
+                shuffle=False,
+                num_workers=opt.n_threads,
+                pin_memory=True,
+                worker_init_fn=worker_init_fn)
+            test.test(test_loader, model, opt, test_data.class_names, eval_device_transform)
\ No newline at end of file
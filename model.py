@@ -18,8 +18,10 @@ def generate_model_3d(opt):
             width_mult=opt.width_mult,
             net=opt.model,
             modalities=opt.modalities,
+            concurrent_modalities=opt.concurrent_modalities,
             mod_aggr=opt.mod_aggr,
             feat_fusion=opt.feat_fusion,
+            shared_layers=opt.shared_layers,
             ssa_loss=opt.SSA_loss)
     elif opt.model == 'resnext':
         model = consensus_module_3dcnn.get_model(
@@ -31,8 +33,10 @@ def generate_model_3d(opt):
             sample_duration=opt.sample_duration,
             net=opt.model,
             modalities=opt.modalities,
+            concurrent_modalities=opt.concurrent_modalities,
             mod_aggr=opt.mod_aggr,
             feat_fusion=opt.feat_fusion,
+            shared_layers=opt.shared_layers,
             ssa_loss=opt.SSA_loss)
     elif opt.model == 'res3d_clstm_mn':
         model = consensus_module_3dcnn.get_model(
@@ -42,6 +46,7 @@ def generate_model_3d(opt):
             sample_duration=opt.sample_duration,
             net=opt.model,
             modalities=opt.modalities,
+            concurrent_modalities=opt.concurrent_modalities,
             mod_aggr=opt.mod_aggr)
     elif opt.model == 'raar3d':
         # from models.res3d_clstm_mobilenet import get_fine_tuning_parameters
@@ -52,6 +57,7 @@ def generate_model_3d(opt):
             sample_duration=opt.sample_duration,
             net=opt.model,
             modalities=opt.modalities,
+            concurrent_modalities=opt.concurrent_modalities,
             mod_aggr=opt.mod_aggr,
             shallow_layer_num=opt.shallow_layer_num,
             middle_layer_num=opt.middle_layer_num,
@@ -65,6 +71,7 @@ def generate_model_3d(opt):
             sample_duration=opt.sample_duration,
             net=opt.model,
             modalities=opt.modalities,
+            concurrent_modalities=opt.concurrent_modalities,
             mod_aggr=opt.mod_aggr,
             shallow_layer_num=opt.shallow_layer_num,
             middle_layer_num=opt.middle_layer_num,
@@ -78,6 +85,7 @@ def generate_model_3d(opt):
             sample_duration=opt.sample_duration,
             net=opt.model,
             modalities=opt.modalities,
+            concurrent_modalities=opt.concurrent_modalities,
             mod_aggr=opt.mod_aggr
             )
 
@@ -107,6 +115,8 @@ def generate_model_3d(opt):
                 else:
                     model.load_state_dict(pretrain['state_dict'])
             else:
+                # each checkpoint would overwrite the shared stages with the weights of its modality
+                assert opt.shared_layers == 0, 'the pretrained models of the single modalities cannot be loaded with --shared_layers'
                 opt.pretrain_path = os.path.join(opt.pretrain_path, opt.dataset, opt.model)
                 for i in range(len(opt.modalities)):
                     pretrain_path = '_'.join([opt.dataset, opt.model, opt.modalities[i], 'none', 'best.pth'])
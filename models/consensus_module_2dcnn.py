@@ -75,35 +75,35 @@ class ConsensusModule2DCNN(nn.Module):
                 nn.Linear(self.num_classes * len(self.modalities), self.num_classes)
             )
     
+    def forward_frames(self, x: Tensor, i: int) -> Tensor:
+        """(B x T x K) outputs of the 2D-CNN of the modality i for each frame of the (B x M x T x C x H x W) clips:
+        the time is folded into the batch, so the B * T frames are run in a single call of the network."""
+        b, t = x.size(0), x.size(2)
+        frames_output = self.mod_nets[i](x[:, i].flatten(0, 1))
+        return frames_output.view(b, t, -1)
+    
     def forward(self, x: Tensor) -> Tensor:
         # print('0 - INPUT SAMPLE: ', x.size())
         cnns_outputs = list()
         for i in range(x.size(1)):
             if self.temp_aggr == 'MLP':
-                # iterate on the frames
+                # outputs of the frames concatenated in temporal order
                 # print('1 - cons_2dcnn x size: ', x[:, i, 0, :, :, :].size())
-                # cnn_output = torch.cat([self.mod_nets[i][j](x[:, i, j, :, :, :]) for j in range(x.size(2))], dim=1)  # self.cnns[i](x[:, 0, i, :, :, :])[0], have insert [0], because the forward of Mobilenet2d return also the features
-                cnn_output = torch.cat([self.mod_nets[i](x[:, i, j, :, :, :]) for j in range(x.size(2))], dim=1)
+                cnn_output = self.forward_frames(x, i).flatten(1)
                 # print('2 - cons_2dcnn cnn size: ', cnn_output.size())
                 cnn_output = self.temp_aggregators[i](cnn_output)
             elif self.temp_aggr == 'LSTM':
-                h_0 = torch.randn(2, x.size(0), self.n_finetune_classes).cuda()
-                c_0 = torch.randn(2, x.size(0), self.n_finetune_classes).cuda()
-                for j in range(x.size(1)):
-                    # pred = self.mod_nets[i][j](x[:, i, j, :, :, :])
-                    pred = self.mod_nets[i](x[:, i, j, :, :, :])
-                    x1, (h_0, c_0) = self.temp_aggregators[i](pred.view(-1, x.size(0), self.n_finetune_classes), (h_0, c_0))
+                h_0 = torch.randn(2, x.size(0), self.n_finetune_classes, device=x.device)
+                c_0 = torch.randn(2, x.size(0), self.n_finetune_classes, device=x.device)
+                # the sequence of the outputs of the frames, (T x B x K), in a single call of the LSTM
+                x1, (h_0, c_0) = self.temp_aggregators[i](self.forward_frames(x, i).transpose(0, 1), (h_0, c_0))
                 cnn_output = x1[-1]
                 cnn_output = cnn_output.view(cnn_output.size(0), -1, cnn_output.size(1))      # stack output of bidirectional cells, because it is doubled
                 cnn_output = cnn_output.mean(dim=1)                                           # average the output of bidirectional cells
             elif self.temp_aggr == 'avg':
-                # cnn_output = torch.stack([self.mod_nets[i][j](x[:, i, j, :, :, :]) for j in range(x.size(2))], dim=1)
-                cnn_output = torch.stack([self.mod_nets[i](x[:, i, j, :, :, :]) for j in range(x.size(2))], dim=1)
-                cnn_output = cnn_output.mean(dim=1)
+                cnn_output = self.forward_frames(x, i).mean(dim=1)
             elif self.temp_aggr == 'max':
-                # cnn_output = torch.stack([self.mod_nets[i][j](x[:, i, j, :, :, :]) for j in range(x.size(2))], dim=1)
-                cnn_output = torch.stack([self.mod_nets[i][j](x[:, i, j, :, :, :]) for j in range(x.size(2))], dim=1)
-                cnn_output = cnn_output.max(dim=1)
+                cnn_output = self.forward_frames(x, i).max(dim=1)[0]
             else:
                 cnn_output = None
             cnns_outputs.append(cnn_output)
@@ -1,6 +1,8 @@
+import os
 import torch
 from torch import nn
 from torch import Tensor
+from concurrent.futures import ThreadPoolExecutor
 from torch.autograd import Variable
 from torchinfo import summary
 # from torchsummary import summary
@@ -18,8 +20,76 @@ import RAAR3DNet, NI3D
 from EAN_16f import resnet101 as transformer
 #'''
 
+
+_pools = dict()
+_streams = dict()
+
+
+def _get_stream(device, index):
+    """Side CUDA stream of each modality of the device, created at the first call."""
+    key = (device, index)
+    if key not in _streams:
+        _streams[key] = torch.cuda.Stream(device)
+    return _streams[key]
+
+
+def _autocast_cpu_state():
+    """(enabled, dtype) of the CPU autocast of the thread, None if torch has no CPU autocast (before 1.10)."""
+    if hasattr(torch, 'get_autocast_dtype'):     # torch >= 2.4
+        return torch.is_autocast_enabled('cpu'), torch.get_autocast_dtype('cpu')
+    if hasattr(torch, 'is_autocast_cpu_enabled'):
+        return torch.is_autocast_cpu_enabled(), torch.get_autocast_cpu_dtype()
+    return None
+
+
+def _in_caller_mode(function):
+    """Wraps function to run it with the grad mode and the CPU autocast state of the calling thread, which are
+    thread local and not inherited by the threads of the pool."""
+    grad_enabled = torch.is_grad_enabled()
+    autocast = _autocast_cpu_state()
+
+    def run(input):
+        with torch.set_grad_enabled(grad_enabled):
+            if autocast is None:
+                return function(input)
+            with torch.autocast('cpu', enabled=autocast[0], dtype=autocast[1]):
+                return function(input)
+    return run
+
+
+def run_concurrently(functions, inputs):
+    """
+    Returns [function(input) for function, input in zip(functions, inputs)], the calls being run concurrently:
+    on a side CUDA stream for each call for CUDA inputs, on a thread for each call otherwise (the CPU kernels
+    release the GIL; the calls share the intra-op threads of torch).
+    """
+    if inputs[0].is_cuda:
+        device = inputs[0].device
+        current = torch.cuda.current_stream(device)
+        outputs = []
+        for i, (function, input) in enumerate(zip(functions, inputs)):
+            stream = _get_stream(device, i)
+            stream.wait_stream(current)
+            with torch.cuda.stream(stream):
+                # the input, allocated on the current stream, must not be reused before the side stream is done
+                input.record_stream(stream)
+                outputs.append(function(input))
+        for i in range(len(functions)):
+            current.wait_stream(_get_stream(device, i))
+        for output in outputs:
+            for tensor in output:
+                if isinstance(tensor, Tensor):
+                    tensor.record_stream(current)
+        return outputs
+    key = (os.getpid(), len(functions))
+    if key not in _pools:
+        _pools[key] = ThreadPoolExecutor(len(functions))
+    futures = [_pools[key].submit(_in_caller_mode(function), input) for function, input in zip(functions, inputs)]
+    return [future.result() for future in futures]
+
+
 class ConsensusModule3DCNN(nn.Module):
-    def __init__(self, num_classes=249, n_finetune_classes=249, sample_size=112, sample_duration=16, mod_aggr='avg', net=resnext, modalities=['RGB'], feat_fusion=False, **kwargs):
+    def __init__(self, num_classes=249, n_finetune_classes=249, sample_size=112, sample_duration=16, mod_aggr='avg', net=resnext, modalities=['RGB'], feat_fusion=False, shared_layers=0, concurrent_modalities=False, **kwargs):
         super(ConsensusModule3DCNN, self).__init__()
         self.sample_duration = sample_duration
         self.num_classes = num_classes
@@ -34,6 +104,14 @@ class ConsensusModule3DCNN(nn.Module):
                 cnn = net(num_classes=num_classes, sample_size=sample_size, sample_duration=sample_duration, **kwargs)
             self.cnns.append(cnn)
         
+        # the first shared_layers stages of the backbones are shared by the modalities, and run once on all of them
+        self.shared_layers = shared_layers if len(self.modalities) > 1 else 0
+        if self.shared_layers > 0:
+            assert all(hasattr(cnn, 'share_stages') for cnn in self.cnns), 'shared_layers is not supported by {}'.format(type(self.cnns[0]).__name__)
+            for cnn in self.cnns[1:]:
+                cnn.share_stages(self.cnns[0], self.shared_layers)
+        self.concurrent_modalities = concurrent_modalities
+        
         self.mod_aggr = mod_aggr
         self.aggregator = None
         assert(self.mod_aggr in ['MLP', 'avg', 'max', 'none'])
@@ -49,30 +127,37 @@ class ConsensusModule3DCNN(nn.Module):
             )
     
     
+    def forward_modalities(self, x: Tensor):
+        """Runs the backbone of each modality (concurrently with concurrent_modalities), returning the lists of
+        their outputs and features."""
+        if self.shared_layers > 0:
+            b, m = x.size(0), x.size(1)
+            # the shared stages run once on the (M x B) clips of all the modalities
+            x = self.cnns[0].forward_stages(x.transpose(0, 1).flatten(0, 1), 0, self.shared_layers).unflatten(0, (m, b))
+            inputs = [x[i] for i in range(m)]
+            functions = [lambda x, cnn=cnn: cnn.forward_head(cnn.forward_stages(x, self.shared_layers)) for cnn in self.cnns]
+        else:
+            inputs = [x[:, i, :, :, :, :] for i in range(x.size(1))]
+            functions = list(self.cnns[:len(inputs)])
+        if self.concurrent_modalities and len(inputs) > 1:
+            # the backbones of the modalities are independent, so they are run at the same time
+            cnns_output = run_concurrently(functions, inputs)
+        else:
+            cnns_output = [function(input) for function, input in zip(functions, inputs)]
+        return [output[0] for output in cnns_output], [output[1] for output in cnns_output]
+    
     def forward(self, x: Tensor) -> Tensor:
         # print('ConsensusModule3DCNN input shape: {}'.format(x.size()))  # (16, 1, 3, 16, 112, 112)
-        cnns_outputs = list()
-        cnns_features = list()
         if self.mod_aggr == 'MLP':
-            # iterate on the modalities
-            for i in range(x.size(1)):
-                cnn_output = self.cnns[i](x[:, i, :, :, :, :])
-                cnns_outputs.append(cnn_output[0])
-                cnns_features.append(cnn_output[1])
+            cnns_outputs, cnns_features = self.forward_modalities(x)
             x = torch.cat(cnns_outputs, dim=1)
             x = self.aggregator(x)
         elif self.mod_aggr == 'avg':
-            for i in range(x.size(1)):
-                cnn_output = self.cnns[i](x[:, i, :, :, :, :])
-                cnns_outputs.append(cnn_output[0])
-                cnns_features.append(cnn_output[1])
+            cnns_outputs, cnns_features = self.forward_modalities(x)
             x = torch.stack(cnns_outputs, dim=1)
             x = x.mean(dim=1)
         elif self.mod_aggr == 'max':
-            for i in range(x.size(1)):
-                cnn_output = self.cnns[i](x[:, i, :, :, :, :])
-                cnns_outputs.append(cnn_output[0])
-                cnns_features.append(cnn_output[1])
+            cnns_outputs, cnns_features = self.forward_modalities(x)
             x = torch.stack(cnns_outputs, dim=1)
             x = x.max(dim=1)
         elif self.mod_aggr == 'none':  # the case in which use a single modality
@@ -124,8 +124,9 @@ class ConvLSTM(nn.Module):
         ----------
         input_tensor: todo
             5-D Tensor either of shape (t, b, c, h, w) or (b, t, c, h, w)
-        hidden_state: todo
-            None. todo implement stateful
+        hidden_state: list of (h, c), optional
+            States of all the layers to start from (e.g. the last_state_list of a previous call with
+            return_all_layers, or ConvLSTMState.states), zeros if None.
         Returns
         -------
         last_state_list, layer_output
@@ -136,9 +137,9 @@ class ConvLSTM(nn.Module):
 
         b, _, _, h, w = input_tensor.size()
 
-        # Implement stateful ConvLSTM
         if hidden_state is not None:
-            raise NotImplementedError()
+            if len(hidden_state) != self.num_layers:
+                raise ValueError('hidden_state must have the states of all the {} layers'.format(self.num_layers))
         else:
             # Since the init is done in forward. Can send image size here
             hidden_state = self._init_hidden(batch_size=b,
@@ -171,6 +172,25 @@ class ConvLSTM(nn.Module):
 
         return layer_output_list, last_state_list
 
+    def step(self, input_frame, hidden_state):
+        """
+        One time step of all the layers, for causal inference frame by frame.
+        Parameters
+        ----------
+        input_frame: 4-D Tensor of shape (b, c, h, w)
+        hidden_state: list of (h, c) of all the layers
+        Returns
+        -------
+        output of the last layer (b, hidden_dim, h, w), list of the new (h, c) of all the layers
+        """
+        cur_input = input_frame
+        next_state = []
+        for layer_idx in range(self.num_layers):
+            h, c = self.cell_list[layer_idx](input_tensor=cur_input, cur_state=hidden_state[layer_idx])
+            next_state.append([h, c])
+            cur_input = h
+        return cur_input, next_state
+
     def _init_hidden(self, batch_size, image_size):
         init_states = []
         for i in range(self.num_layers):
@@ -190,6 +210,64 @@ class ConvLSTM(nn.Module):
         return param
 
 
+class ConvLSTMState(nn.Module):
+
+    """
+    Stateful ConvLSTM for streaming inference: keeps (h, c) of all the layers for a batch of independent streams
+    across calls, so that each new frame costs one ConvLSTMCell step for each layer instead of running the
+    ConvLSTM on the whole sample_duration window again.
+    Parameters:
+        convlstm: ConvLSTM whose cells are run (its weights are shared)
+    Input:
+        A tensor of size B, C, H, W (one frame for each stream) or B, T, C, H, W (T frames for each stream)
+    Output:
+        The output of the last layer for the last frame, B, hidden_dim[-1], H, W
+    Example:
+        >> stateful = ConvLSTMState(convlstm)
+        >> for frames in stream:  # (n_streams, C, H, W)
+        >>     h = stateful(frames)
+        >>     stateful.reset(ended)  # bool mask of the streams to restart
+    """
+
+    def __init__(self, convlstm):
+        super(ConvLSTMState, self).__init__()
+        self.convlstm = convlstm
+        self.states = None
+
+    def reset(self, streams=None):
+        """
+        Restarts the streams from zero states.
+        Parameters
+        ----------
+        streams: bool Tensor of shape (b,), or list of indices of the streams, all the streams if None
+        """
+        if streams is None or self.states is None:
+            self.states = None
+            return
+        h = self.states[0][0]
+        mask = torch.zeros(h.size(0), dtype=torch.bool, device=h.device)
+        mask[torch.as_tensor(streams, device=h.device)] = True
+        mask = mask.view(-1, 1, 1, 1)
+        self.states = [[h.masked_fill(mask, 0), c.masked_fill(mask, 0)] for h, c in self.states]
+
+    def detach(self):
+        """Detaches the states from the graph of the previous frames (truncated backpropagation through time)."""
+        if self.states is not None:
+            self.states = [[h.detach(), c.detach()] for h, c in self.states]
+
+    def forward(self, input_tensor):
+        # the chunks are always batch first, whatever the batch_first of the ConvLSTM
+        frames = input_tensor if input_tensor.dim() == 5 else input_tensor.unsqueeze(1)
+        b, _, _, h, w = frames.size()
+        if self.states is None:
+            self.states = self.convlstm._init_hidden(batch_size=b, image_size=(h, w))
+        elif self.states[0][0].size(0) != b:
+            raise ValueError('the batch has {} streams, the states {}'.format(b, self.states[0][0].size(0)))
+        for t in range(frames.size(1)):
+            output, self.states = self.convlstm.step(frames[:, t], self.states)
+        return output
+
+
 if __name__ == "__main__":
     kwargs = dict()
     # input_shape = (256, 16, 28, 28)
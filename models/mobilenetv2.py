@@ -119,6 +119,20 @@ class MobileNetV2(nn.Module):
 
     def forward(self, x):
         x = self.features(x)
+        return self.forward_head(x)
+
+    def forward_stages(self, x, begin=0, end=None):
+        """Runs the stages [begin, end) of the network (the modules of features)."""
+        for stage in self.features[begin:end]:
+            x = stage(x)
+        return x
+
+    def share_stages(self, other, n):
+        """Replaces the first n stages of the network with the ones of other, sharing their weights."""
+        for i in range(n):
+            self.features[i] = other.features[i]
+
+    def forward_head(self, x):
         x = F.avg_pool3d(x, x.data.size()[-3:])
         
         # For SSA loss
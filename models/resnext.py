@@ -82,6 +82,8 @@ class ResNeXtBottleneck(nn.Module):
 
 
 class ResNeXt(nn.Module):
+    # modules of each stage, in the order of forward_stages
+    stage_names = [['conv1', 'bn1', 'maxpool'], ['layer1'], ['layer2'], ['layer3'], ['layer4']]
 
     def __init__(self,
                  block,
@@ -182,16 +184,28 @@ class ResNeXt(nn.Module):
             # image = image.div(255)    # to visualize with real colors
             save_image(image, '{:02d}_{:02d}.png'.format(self.index, frame))
         #'''
+        x = self.forward_stages(x)
+        return self.forward_head(x)
+
+    def _stem(self, x):
         x = self.conv1(x)
         x = self.bn1(x)
         x = self.relu(x)
-        x = self.maxpool(x)
+        return self.maxpool(x)
+
+    def forward_stages(self, x, begin=0, end=None):
+        """Runs the stages [begin, end) of the network (stem, layer1, ..., layer4)."""
+        for stage in [self._stem, self.layer1, self.layer2, self.layer3, self.layer4][begin:end]:
+            x = stage(x)
+        return x
 
-        x = self.layer1(x)
-        x = self.layer2(x)
-        x = self.layer3(x)
-        x = self.layer4(x)
+    def share_stages(self, other, n):
+        """Replaces the first n stages of the network with the ones of other, sharing their weights."""
+        for names in self.stage_names[:n]:
+            for name in names:
+                setattr(self, name, getattr(other, name))
 
+    def forward_head(self, x):
         x = self.avgpool(x)
         
         # For SSA loss
@@ -17,6 +17,8 @@ def parse_opts():
     parser.add_argument('--no_cuda', action='store_true', help='If true, cuda is not used.')
     parser.set_defaults(no_cuda=False)
     parser.add_argument('--n_threads', default=16, type=int, help='Number of threads for multi-thread loading')
+    parser.add_argument('--io_threads', default=0, type=int, help='Number of threads of each loading process reading and decoding the frames of a clip. 0 reads the frames one after the other.')
+    parser.add_argument('--max_inflight_frames', default=32, type=int, help='Maximum number of frames submitted to the I/O threads of a loading process at a time.')
     parser.add_argument('--checkpoint', default=1, type=int, help='Trained model is saved at every this epochs.')
     parser.add_argument('--manual_seed', default=1, type=int, help='Manually set random seed')
 
@@ -27,9 +29,16 @@ def parse_opts():
     parser.add_argument('--n_finetune_classes', default=400, type=int, help='Number of classes for fine-tuning. n_classes is set to the number when pretraining.')
     parser.add_argument('--sample_size', default=112, type=int, help='Height and width of inputs')
     parser.add_argument('--sample_duration', default=16, type=int, help='Temporal duration of inputs')
+    parser.add_argument('--index_dir', default='', type=str, help='Directory of the compiled sample indexes of the annotation files (see datasets/sample_index.py). Empty for ~/.cache/gesture_recognition/sample_index.')
+    parser.add_argument('--frame_cache', default='', type=str, help='Directory of the memory-mapped cache of decoded and scaled frames, used in validation and test. Empty to decode the frames at each epoch.')
+    parser.add_argument('--jpeg_draft', action='store_true', help='If true, the JPEG frames are decoded at a reduced resolution (1/2, 1/4 or 1/8) when it is not below the size required by the spatial transforms.')
+    parser.set_defaults(jpeg_draft=False)
+    parser.add_argument('--video_backend', default='frames', type=str, help='Source of the frames of isogd and nvgesture. frames reads the extracted frames (see --frame_store), container decodes them from the recorded .avi videos (frames | container)')
+    parser.add_argument('--frame_store', default='jpeg', type=str, help='Storage format of the frames. jpeg is one file for each frame, packed is one file for each video created by utils/pack_frames.py (jpeg | packed)')
     
     ############### PRE-PROCESSING ###############
     parser.add_argument('--downsample', default=2, type=int, help='Downsampling. Selecting 1 frame out of N')
+    parser.add_argument('--temporal_sampling', default='crop', type=str, choices=['crop', 'segment'], help='Frames of the clips: crop (sample_duration frames, one every downsample frames, at a random position in training and at the center in validation and test) or segment (as TSN, one frame from each of sample_duration segments of equal length covering the whole video, at a random position in training and at the center of the segment otherwise; ignores downsample).')
     parser.add_argument('--initial_scale', default=1.0, type=float, help='Initial scale for multiscale cropping')
     parser.add_argument('--n_scales', default=5, type=int, help='Number of scales for multiscale cropping')
     parser.add_argument('--scale_step', default=0.95, type=float, help='Scale step for multiscale cropping')
@@ -41,6 +50,10 @@ def parse_opts():
     parser.set_defaults(std_norm=False)
     parser.add_argument('--no_hflip', action='store_true', help='If true horizontal flipping is not performed.')
     parser.set_defaults(no_hflip=False)
+    parser.add_argument('--device_transforms', action='store_true', help='If true, the DataLoader workers return uint8 clips, and float conversion, normalization, brightness jitter and elastic displacement are applied to the whole batch on the training device. The rotation, resize and crop of the frames stay in the workers, in the same order.')
+    parser.set_defaults(device_transforms=False)
+    parser.add_argument('--elastic_displacement', action='store_true', help='If true, the training clips are warped by a random elastic displacement.')
+    parser.set_defaults(elastic_displacement=False)
     parser.add_argument('--norm_value', default=1, type=int, help='If 1, range of inputs is [0-255]. If 255, range of inputs is [0-1].')
     parser.add_argument('--scale_in_test', default=1.0, type=float, help='Spatial scale in test')
     parser.add_argument('--crop_position_in_test', default='c', type=str, help='Cropping method (c | tl | tr | bl | br) in test')    
@@ -62,6 +75,9 @@ def parse_opts():
     parser.add_argument('--mod_aggr', default='none', type=str, help='(MLP | avg | max | none')
     parser.add_argument('--feat_fusion', action='store_true', help='If true, modalities fusion is applied to feature level')
     parser.set_defaults(feat_fusion=False)
+    parser.add_argument('--concurrent_modalities', action='store_true', help='If true, the separate 3D CNNs of the modalities are run at the same time, each one on its own CUDA stream (on its own thread on CPU), instead of one after the other.')
+    parser.set_defaults(concurrent_modalities=False)
+    parser.add_argument('--shared_layers', default=0, type=int, help='Number of initial stages of the 3D CNNs (resnext: stem, layer1-4; mobilenetv2: the blocks of features) shared by the modalities and run once on the clips of all of them, the following ones being specific to each modality. 0 for a separate network for each modality. With --SSA_loss the shared stages are updated by the optimizer of the first modality only; not supported with the pretrained models of the single modalities (--pretrain_path directory).')
     
     ############### TRAINING PARAMETERS ###############
     parser.add_argument('--learning_rate', default=0.04, type=float, help='Initial learning rate (divided by 10 while training by lr scheduler)')
@@ -92,8 +108,17 @@ def parse_opts():
     parser.add_argument('--test', action='store_true', help='If true, test is performed.')
     parser.set_defaults(test=False)
     parser.add_argument('--test_subset', default='val', type=str, help='Used subset in test (val | test)')
+    parser.add_argument('--dense_test', action='store_true', help='If true, each test video is scored as a whole, averaging the scores of sliding windows over it; the frames shared by overlapping windows are read and transformed once.')
+    parser.set_defaults(dense_test=False)
+    parser.add_argument('--dense_test_step', default=0, type=int, help='Frames between the beginnings of consecutive windows of the dense test (half a window if 0).')
+    parser.add_argument('--dense_test_clips', default=0, type=int, help='If > 0, the dense test averages the scores of this number of clips evenly spaced over each video (as in the multi-clip testing of SlowFast) instead of sliding windows.')
     parser.add_argument('--preds_per_video', default=10, type=int, help='number of predictions returned by the system for each video')
 
+    ############### SERVER ###############
+    parser.add_argument('--server_address', default='/tmp/gesture_recognition.sock', type=str, help='Address of the inference server (server.py): path of a Unix socket, or host:port for a TCP socket on the loopback.')
+    parser.add_argument('--server_batch_size', default=8, type=int, help='Maximum number of clips of the clients scored together by the inference server.')
+    parser.add_argument('--server_max_latency', default=10, type=float, help='Maximum time (ms) a clip waits for other clips to fill a batch of the inference server.')
+
     args = parser.parse_args()
 
     return args
@@ -0,0 +1,61 @@
+'''
+Random number generators of the data transforms.
+
+Each process (the main process and each DataLoader worker) has its own generators: a random.Random, from which
+the transforms draw their parameters (randomize_parameters, TemporalRandomCrop), and a torch.Generator, from which
+the noise of the clips is drawn (e.g. SaltImage). They are seeded with opt.manual_seed in the main process
+(seed_all) and with the torch seed of the worker, base_seed + worker_id, in the DataLoader workers (worker_init_fn):
+base_seed is drawn by the DataLoader from the generator of the main process, so a run is reproduced by
+running it again with the same --manual_seed, and the workers draw different values.
+The generators are created once for each process: the transforms never reseed them from the OS entropy.
+'''
+
+import os
+import random
+import numpy as np
+import torch
+
+
+_states = dict()
+
+
+def seed_process(seed):
+    """Seeds the generators of the current process."""
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    _states[os.getpid()] = (random.Random(seed), generator)
+
+
+def _get_state():
+    if os.getpid() not in _states:
+        # e.g. a worker started without worker_init_fn
+        seed_process(torch.initial_seed())
+    return _states[os.getpid()]
+
+
+def get_random():
+    """Returns the random.Random of the current process."""
+    return _get_state()[0]
+
+
+def get_generator():
+    """Returns the torch.Generator of the current process."""
+    return _get_state()[1]
+
+
+def seed_all(seed):
+    """Seeds the global generators of torch, random and numpy and the ones of the transforms of the main process."""
+    torch.manual_seed(seed)
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    seed_process(seed)
+
+
+def worker_init_fn(worker_id):
+    """worker_init_fn of the DataLoaders: seeds the generators of the worker from its torch seed.
+    The global generators of random and numpy are seeded too, otherwise they are copied from the main process
+    and draw the same values in all the workers."""
+    seed = torch.initial_seed()
+    random.seed(seed)
+    np.random.seed(seed % 2 ** 32)
+    seed_process(seed)
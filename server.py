@@ -0,0 +1,354 @@
+'''
+Inference server: the model is loaded once (from --resume_path) and scores the clips of many clients (e.g. one for
+each camera), grouped in micro-batches. A batch is run as soon as it has --server_batch_size clips, or when its first
+clip has waited --server_max_latency ms, so the clips of the clients share the forward passes of the model without
+adding more than the deadline to their latency.
+
+    python server.py --dataset nvgesture --annotation_path nvgesture.json --model resnext --modalities RGB D \\
+        --resume_path model.pth --gpu 0 --server_address /tmp/gesture_recognition.sock
+
+The clients connect to the Unix socket (or to host:port on the loopback) and send the preprocessed clips, as the
+samples of the validation set ((M x C x T x H x W) float32 for the 3D CNNs, (M x T x C x H x W) otherwise):
+
+    client = InferenceClient('/tmp/gesture_recognition.sock')
+    result = client.predict(clip)   # {'scores': [...], 'results': [{'label': ..., 'score': ...}, ...]}
+    print(client.stats())           # queue depth, batch sizes and latency percentiles of the server
+
+Each message is a JSON header and an optional .npy payload, each one preceded by its length.
+'''
+
+import io
+import os
+import json
+import ipaddress
+import time
+import queue
+import socket
+import struct
+import threading
+import collections
+import socketserver
+import numpy as np
+import torch
+from concurrent.futures import Future
+
+from streaming import LatencyStats
+
+
+MAX_HEADER_SIZE = 1 << 16       # bytes of the JSON header of a message
+NPY_HEADER_SIZE = 1 << 12       # margin for the header of the .npy payload of a clip
+
+
+class MessageSizeError(ValueError):
+    """Message longer than the receiver accepts. It is left unread, so the connection cannot be used anymore."""
+
+
+def send_message(sock, header, array=None):
+    payload = b''
+    if array is not None:
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        payload = buffer.getvalue()
+    header = json.dumps(header).encode()
+    sock.sendall(struct.pack('!IQ', len(header), len(payload)) + header + payload)
+
+
+def _recv_exactly(sock, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise ConnectionError('connection closed')
+        received += n
+    return data
+
+
+def recv_message(sock, max_payload_size=None):
+    """
+    Returns the (header, array) of the next message, array being None if it has no payload.
+    Raises ConnectionError if the connection is closed, and ValueError if the header is not a JSON object or the
+    payload is not a .npy array of a numeric dtype (the whole message is read first, so that the next message can
+    still be received). Raises MessageSizeError, before reading them, if the header is longer than MAX_HEADER_SIZE
+    or the payload longer than max_payload_size bytes.
+    """
+    header_size, payload_size = struct.unpack('!IQ', _recv_exactly(sock, struct.calcsize('!IQ')))
+    if header_size > MAX_HEADER_SIZE:
+        raise MessageSizeError('header of {} bytes, the maximum is {}'.format(header_size, MAX_HEADER_SIZE))
+    if max_payload_size is not None and payload_size > max_payload_size:
+        raise MessageSizeError('payload of {} bytes, the maximum is {}'.format(payload_size, max_payload_size))
+    header = _recv_exactly(sock, header_size)
+    payload = _recv_exactly(sock, payload_size) if payload_size > 0 else None
+    header = json.loads(bytes(header))
+    if not isinstance(header, dict):
+        raise ValueError('the header is not a JSON object')
+    array = None
+    if payload is not None:
+        try:
+            array = np.load(io.BytesIO(payload), allow_pickle=False)
+        except EOFError as e:
+            raise ValueError('truncated .npy payload') from e
+        if not isinstance(array, np.ndarray):
+            raise ValueError('the payload is not a .npy array')
+    return header, array
+
+
+def parse_address(address):
+    """
+    (family, address) of a Unix socket path or of a host:port TCP address. The server has no authentication, so
+    the TCP hosts are restricted to the loopback (localhost, 127.0.0.0/8).
+    """
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        if host != 'localhost':
+            try:
+                loopback = ipaddress.IPv4Address(host).is_loopback
+            except ValueError:
+                loopback = False
+            if not loopback:
+                raise ValueError('{} is not a loopback host, use localhost or 127.0.0.1'.format(host))
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+class ServerStats(object):
+    """
+    Queue depth, histogram of the batch sizes and latencies (from the arrival of a clip to its scores) of a
+    MicroBatcher.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.max_queue_depth = 0
+        self.batch_sizes = collections.Counter()
+        self.latency = LatencyStats()
+
+    def update_queue(self, depth):
+        with self.lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def update_batch(self, size, latencies):
+        with self.lock:
+            self.batch_sizes[size] += 1
+            for latency in latencies:
+                self.latency.update(latency)
+
+    def summary(self, queue_depth):
+        with self.lock:
+            return {
+                'queue_depth': queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                'latency': self.latency.summary(),
+            }
+
+
+class MicroBatcher(object):
+    """
+    Groups the clips submitted by the threads of the clients in batches, run by a single thread.
+    Args:
+        run_batch (callable): Function taking a (B x ...) batch of clips and returning the list of their B results.
+        max_batch_size (int): Maximum number of clips of a batch.
+        max_latency (float): Maximum time (seconds) the first clip of a batch waits for the other ones.
+    """
+
+    def __init__(self, run_batch, max_batch_size, max_latency):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.queue = queue.Queue()
+        self.stats = ServerStats()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, clip):
+        """Queues a clip and returns the Future of its result."""
+        future = Future()
+        self.queue.put((clip, future, time.time()))
+        self.stats.update_queue(self.queue.qsize())
+        return future
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _next_batch(self):
+        item = self.queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = item[2] + self.max_latency
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            try:
+                item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)    # closes after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                results = self.run_batch(torch.stack([torch.as_tensor(clip) for clip, _, _ in batch]))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            end_time = time.time()
+            for (_, future, arrival_time), result in zip(batch, results):
+                future.set_result(result)
+            self.stats.update_batch(len(batch), [end_time - arrival_time for _, _, arrival_time in batch])
+
+
+class InferenceHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                header, clip = recv_message(self.request, server.max_payload_size)
+            except ConnectionError:
+                return
+            except MessageSizeError as e:
+                send_message(self.request, {'error': 'invalid message: {}'.format(e)})
+                return
+            except ValueError as e:
+                send_message(self.request, {'error': 'invalid message: {}'.format(e)})
+                continue
+            op = header.get('op', 'predict')
+            if op == 'stats':
+                response = server.batcher.stats.summary(server.batcher.queue.qsize())
+            elif op != 'predict':
+                response = {'error': 'unknown op {}'.format(op)}
+            elif clip is None or tuple(clip.shape) != server.clip_shape:
+                response = {'error': 'expected a clip of shape {}, got {}'.format(
+                    server.clip_shape, None if clip is None else tuple(clip.shape))}
+            else:
+                try:
+                    response = server.batcher.submit(clip.astype(np.float32, copy=False)).result()
+                except Exception as e:
+                    response = {'error': repr(e)}
+            send_message(self.request, response)
+
+
+def make_server(address, batcher, clip_shape):
+    """
+    Server of the clips of the clients, with one thread for each connection.
+    Args:
+        address (string): Path of the Unix socket, or host:port.
+        batcher (MicroBatcher): Batcher scoring the clips.
+        clip_shape (tuple): Shape of the clips (without the batch dimension).
+    """
+    family, address = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(address):
+            os.remove(address)
+        server_class = socketserver.ThreadingUnixStreamServer
+    else:
+        server_class = socketserver.ThreadingTCPServer
+    server = server_class(address, InferenceHandler)
+    server.daemon_threads = True
+    server.batcher = batcher
+    server.clip_shape = tuple(clip_shape)
+    # a float32 clip in .npy format
+    server.max_payload_size = int(np.prod(clip_shape)) * np.dtype(np.float32).itemsize + NPY_HEADER_SIZE
+    return server
+
+
+class InferenceClient(object):
+    """
+    Connection to the inference server (make_server).
+    Args:
+        address (string): Path of the Unix socket, or host:port.
+    """
+
+    def __init__(self, address):
+        family, address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(address)
+
+    def _request(self, header, array=None):
+        send_message(self.sock, header, array)
+        response, _ = recv_message(self.sock)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+    def predict(self, clip):
+        """Scores of the classes and most likely classes of a clip, as calculate_video_results."""
+        if isinstance(clip, torch.Tensor):
+            clip = clip.cpu().numpy()
+        return self._request({'op': 'predict'}, np.ascontiguousarray(clip, dtype=np.float32))
+
+    def stats(self):
+        return self._request({'op': 'stats'})
+
+    def close(self):
+        self.sock.close()
+
+
+def load_state_dict(model, state_dict):
+    """Loads the checkpoint of a model saved with or without nn.DataParallel."""
+    wrapped = isinstance(model, torch.nn.DataParallel)
+    saved_wrapped = all(key.startswith('module.') for key in state_dict)
+    if saved_wrapped and not wrapped:
+        state_dict = {key[len('module.'):]: value for key, value in state_dict.items()}
+    elif wrapped and not saved_wrapped:
+        state_dict = {'module.' + key: value for key, value in state_dict.items()}
+    model.load_state_dict(state_dict)
+
+
+if __name__ == '__main__':
+    from opts import parse_opts
+    from model import generate_model_2d, generate_model_3d, generate_model_ts
+    from test import forward_outputs, top_k_results
+
+    opt = parse_opts()
+    if opt.gpu is not None:
+        os.environ['CUDA_VISIBLE_DEVICES'] = opt.gpu
+    opt.arch = '{}'.format(opt.model)
+
+    if opt.cnn_dim == 3:
+        model, _ = generate_model_3d(opt)
+        clip_shape = (len(opt.modalities), 3, opt.sample_duration, opt.sample_size, opt.sample_size)
+    else:
+        model, _ = generate_model_2d(opt) if opt.cnn_dim == 2 else generate_model_ts(opt)
+        clip_shape = (len(opt.modalities), opt.sample_duration, 3, opt.sample_size, opt.sample_size)
+    print('loading checkpoint {}'.format(opt.resume_path))
+    checkpoint = torch.load(opt.resume_path, map_location='cpu')
+    assert opt.arch == checkpoint['arch']
+    load_state_dict(model, checkpoint['state_dict'])
+    model.eval()
+
+    with open(opt.annotation_path, 'r') as data_file:
+        class_names = dict(enumerate(json.load(data_file)['labels']))
+
+    def run_batch(inputs):
+        if opt.gpu is not None:
+            inputs = inputs.cuda(non_blocking=True)
+        with torch.no_grad():
+            outputs = forward_outputs(model, inputs, opt).cpu()
+        return [{'scores': scores.tolist(), 'results': top_k_results(scores, class_names, opt.preds_per_video)}
+                for scores in outputs]
+
+    batcher = MicroBatcher(run_batch, opt.server_batch_size, opt.server_max_latency / 1000)
+    server = make_server(opt.server_address, batcher, clip_shape)
+    print('serving on {} (clips of shape {})'.format(opt.server_address, clip_shape))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+        if server.address_family == socket.AF_UNIX and os.path.exists(opt.server_address):
+            os.remove(opt.server_address)
+        print(json.dumps(batcher.stats.summary(batcher.queue.qsize())))
@@ -1,9 +1,10 @@
-import random
 import math
+import inspect
 import numbers
 import collections
 import numpy as np
 import torch
+import torch.nn.functional as F
 import cv2
 import scipy.ndimage
 from PIL import Image, ImageOps
@@ -12,9 +13,100 @@ try:
 except ImportError:
     accimage = None
 
+from random_state import get_random, get_generator
+
+
+def is_clip(img):
+    return isinstance(img, (list, tuple)) or (isinstance(img, (np.ndarray, torch.Tensor)) and img.ndim == 4)
+
+
+def to_raw_clip(clip):
+    """Convert a list of frames or a (T x H x W x C) uint8 array to a (T x H x W x C) uint8 tensor."""
+    if isinstance(clip, (list, tuple)):
+        clip = np.stack([np.asarray(frame) for frame in clip], 0)
+    clip = torch.as_tensor(clip)
+    if clip.ndim == 3:      # single channel frames
+        clip = clip.unsqueeze(-1)
+    return clip
+
+
+def to_clip_tensor(clip):
+    """Convert a list of frames or a (T x H x W x C) uint8 array/tensor to a float tensor of shape (T x C x H x W)."""
+    return to_raw_clip(clip).permute(0, 3, 1, 2).float()
+
+
+# antialias of F.interpolate was added in torch 1.11
+_INTERPOLATE_ANTIALIAS = 'antialias' in inspect.signature(F.interpolate).parameters
+
+
+def resize_clip(clip, size):
+    """Resize a (T x C x H x W) float clip to size=(h, w) with bilinear interpolation, antialiased when downscaling
+    as PIL.Image.BILINEAR."""
+    if tuple(clip.shape[-2:]) == tuple(size):
+        return clip
+    if _INTERPOLATE_ANTIALIAS:
+        return F.interpolate(clip, size=size, mode='bilinear', align_corners=False, antialias=True)
+    # older torch: each channel of each frame is resized by PIL, as a float32 image
+    h, w = size
+    frames = clip.detach().float().cpu().reshape(-1, *clip.shape[-2:]).numpy()
+    resized = np.stack([np.asarray(Image.fromarray(frame).resize((w, h), Image.BILINEAR)) for frame in frames], 0)
+    return torch.from_numpy(resized).view(*clip.shape[:-2], h, w).to(clip.device, clip.dtype)
+
+
+def affine_theta(angles, scales, h, w):
+    """Matrices (N x 2 x 3) of affine_grid rotating counter-clockwise (as PIL) by angles (degrees) and zooming by scales
+    the (h x w) frames around their center, one for each value of angles and scales."""
+    angles = torch.as_tensor(angles, dtype=torch.float32) * (math.pi / 180)
+    scales = torch.as_tensor(scales, dtype=torch.float32)
+    cos, sin, zeros = angles.cos() / scales, angles.sin() / scales, torch.zeros_like(angles)
+    return torch.stack([torch.stack([cos, -sin * h / w, zeros], -1),
+                        torch.stack([sin * w / h, cos, zeros], -1)], -2)
+
+
+def warp_frames(frames, theta=None, displacement=None, mode='bilinear'):
+    """Sample the (N x C x H x W) float frames at an affine grid (theta, N x 2 x 3) plus a displacement
+    (N x H x W x 2, in the normalized coordinates of grid_sample), with a single grid_sample call.
+    The C channels of a frame can hold the channels of all the frames of a clip, which then share the grid."""
+    n, c, h, w = frames.shape
+    if theta is None:
+        theta = torch.eye(2, 3).unsqueeze(0).expand(n, 2, 3)
+    grid = F.affine_grid(theta.to(frames.device, frames.dtype), [n, c, h, w], align_corners=False)
+    if displacement is not None:
+        grid = grid + displacement.to(grid.dtype)
+    return F.grid_sample(frames, grid, mode=mode, padding_mode='zeros', align_corners=False)
+
+
+def elastic_displacement(n, h, w, sigma, alpha, device=None, generator=None):
+    """Random displacements (N x H x W x 2) of the pixels, uniform in [-alpha, alpha] pixels and smoothed with
+    a gaussian filter of standard deviation sigma (as scipy.ndimage.gaussian_filter in constant mode),
+    returned in the normalized coordinates of grid_sample."""
+    noise = torch.rand((n, 2, h, w), device=device, generator=generator).mul_(2).sub_(1)
+    radius = int(4 * sigma + 0.5)
+    x = torch.arange(-radius, radius + 1, dtype=torch.float32, device=device)
+    kernel = torch.exp(-0.5 * (x / sigma) ** 2)
+    kernel = (kernel / kernel.sum()).repeat(2, 1, 1)
+    # separable filter, the two displacement components as separate groups
+    noise = F.conv2d(noise, kernel.unsqueeze(3), padding=(radius, 0), groups=2)
+    noise = F.conv2d(noise, kernel.unsqueeze(2), padding=(0, radius), groups=2)
+    scale = torch.tensor([2. * alpha / w, 2. * alpha / h], device=device)
+    return noise.permute(0, 2, 3, 1) * scale
+
+
+def _interpolation_mode(order):
+    return {0: 'nearest', 1: 'bilinear'}.get(order, 'bicubic')
+
 
 class Compose(object):
     """Composes several transforms together.
+    The transforms can be applied to a single frame (PIL.Image or numpy.ndarray) or to a whole clip,
+    given as a list of frames or as a (T x H x W x C) uint8 array/tensor. In the second case the
+    transforms are applied to all the frames at once with the same random parameters, and a
+    tensor of shape (T x C x H x W) is returned (or the layout of ToNormalizedTensor, see ``clip_layout``).
+    Transforms without a clip implementation (``apply_clip``) are applied frame by frame.
+    The clip is kept as uint8 (T x H x W x C) while the transforms can work on it (``apply_raw_clip``),
+    and converted to float (T x C x H x W) at the first transform that needs it.
+    A clip can be written in a given tensor (``out``, e.g. a slice of a preallocated batch), which a final
+    ToNormalizedTensor fills directly.
     Args:
         transforms (list of ``Transform`` objects): list of transforms to compose.
     Example:
@@ -27,14 +119,68 @@ class Compose(object):
     def __init__(self, transforms):
         self.transforms = transforms
 
-    def __call__(self, img):
+    def __call__(self, img, out=None):
+        if is_clip(img):
+            return self.apply_clip(to_raw_clip(img), out)
         for t in self.transforms:
             img = t(img)
         return img
 
+    def apply_clip(self, clip, out=None):
+        is_raw = True           # True while the clip is the (T x H x W x C) uint8 input
+        is_tensor = False       # True once the values have been converted by ToTensor
+        for i, t in enumerate(self.transforms):
+            kwargs = dict()
+            if out is not None and i == len(self.transforms) - 1 and isinstance(t, ToNormalizedTensor):
+                kwargs['out'] = out
+            if is_raw and hasattr(t, 'apply_raw_clip'):
+                clip, is_raw = t.apply_raw_clip(clip, **kwargs)
+            elif hasattr(t, 'apply_clip'):
+                if is_raw:
+                    clip, is_raw = clip.permute(0, 3, 1, 2).float(), False
+                clip = t.apply_clip(clip, **kwargs)
+            elif is_tensor:
+                clip = torch.stack([t(frame) for frame in clip], 0)
+            else:
+                if is_raw:
+                    frames = clip.numpy()
+                else:
+                    frames = clip.permute(0, 2, 3, 1).clamp(0, 255).round().to(torch.uint8).numpy()
+                if frames.shape[-1] == 1:
+                    frames = frames[..., 0]
+                clip, is_raw = to_clip_tensor([t(Image.fromarray(frame)) for frame in frames]), False
+            is_tensor = is_tensor or isinstance(t, (ToTensor, ToNormalizedTensor))
+        if is_raw:
+            clip = clip.permute(0, 3, 1, 2).float()
+        if out is not None and clip is not out:
+            out.copy_(clip)
+            clip = out
+        return clip
+
+    @property
+    def draft_size(self):
+        """(width, height) at which the frames can be decoded without losing resolution in the output,
+        None if unknown. Known when the frames are scaled to a fixed size (``draft_size`` of the transform)
+        after transforms that only change their size by a factor (``size_factor``)."""
+        factor = 1.
+        for t in self.transforms:
+            if hasattr(t, 'draft_size'):
+                return tuple(int(math.ceil(s / factor)) for s in t.draft_size)
+            if not hasattr(t, 'size_factor'):
+                return None
+            factor *= t.size_factor
+        return None
+
+    @property
+    def clip_layout(self):
+        """Layout of the clips returned by the composed transforms."""
+        for t in reversed(self.transforms):
+            if hasattr(t, 'layout'):
+                return t.layout
+        return 'TCHW'
+
     def randomize_parameters(self):
-        random.seed()               # insert by beis
-        np.random.RandomState()     # insert by beis
+        # the parameters are drawn from the generator of the process (see random_state.py)
         for t in self.transforms:
             t.randomize_parameters()
 
@@ -90,6 +236,9 @@ class ToTensor(object):
         else:
             return img
 
+    def apply_clip(self, clip):
+        return clip.div(self.norm_value)
+
     def randomize_parameters(self):
         pass
 
@@ -121,6 +270,79 @@ class Normalize(object):
             t.sub_(m).div_(s)
         return tensor
 
+    def apply_clip(self, clip):
+        mean = torch.as_tensor(self.mean, dtype=clip.dtype).view(1, -1, 1, 1)
+        std = torch.as_tensor(self.std, dtype=clip.dtype).view(1, -1, 1, 1)
+        return clip.sub(mean).div_(std)
+
+    def randomize_parameters(self):
+        pass
+
+
+class ToNormalizedTensor(object):
+    """ToTensor and Normalize fused in a single stage.
+    Converts a PIL.Image or numpy.ndarray (H x W x C), or a whole clip, in the range [0, 255]
+    to a tensor with values (value / norm_value - mean) / std.
+    Clips are copied once in a preallocated tensor with the requested layout, (T x C x H x W) or
+    (C x T x H x W) as expected by the 3D CNNs, so no further stack and permute copies are needed,
+    and normalized with a single broadcasted operation.
+    Args:
+        norm_value (int): As in ToTensor.
+        mean (sequence): As in Normalize.
+        std (sequence): As in Normalize.
+        dtype (torch.dtype, optional): Type of the output tensor (torch.float32 | torch.float16 | torch.uint8).
+            With torch.uint8 the values are only copied, and the normalization is left to the caller.
+        layout (string, optional): Layout of the output clips ('TCHW' | 'CTHW').
+    """
+
+    def __init__(self, norm_value=255, mean=(0, 0, 0), std=(1, 1, 1), dtype=torch.float32, layout='TCHW'):
+        assert layout in ['TCHW', 'CTHW']
+        self.norm_value = norm_value
+        self.mean = mean
+        self.std = std
+        self.dtype = dtype
+        self.layout = layout
+        # (value / norm_value - mean) / std = value * scale + shift
+        self.scale = torch.tensor([1. / (norm_value * s) for s in std])
+        self.shift = torch.tensor([-m / s for m, s in zip(mean, std)])
+
+    def __call__(self, pic):
+        """
+        Args:
+            pic (PIL.Image or numpy.ndarray): Image to be converted to tensor.
+        Returns:
+            Tensor: Converted image (C x H x W).
+        """
+        frame = torch.from_numpy(np.array(pic))
+        if frame.ndim == 2:
+            frame = frame.unsqueeze(-1)
+        frame = frame.permute(2, 0, 1).unsqueeze(0)
+        return self._convert(frame, 'TCHW')[0]
+
+    def apply_raw_clip(self, clip, out=None):
+        return self._convert(clip.permute(0, 3, 1, 2), self.layout, out), False
+
+    def apply_clip(self, clip, out=None):
+        return self._convert(clip, self.layout, out)
+
+    def _convert(self, clip, layout, out=None):
+        channel_dim = 1
+        if layout == 'CTHW':
+            clip = clip.permute(1, 0, 2, 3)
+            channel_dim = 0
+        if self.dtype == torch.uint8 and clip.is_floating_point():
+            clip = clip.round()
+        if out is None:
+            out = torch.empty(clip.shape, dtype=self.dtype)
+        out.copy_(clip)         # single copy: transposition and type conversion
+        if self.dtype == torch.uint8:
+            return out
+        shape = [1, 1, 1, 1]
+        shape[channel_dim] = -1
+        scale = self.scale.view(shape).to(self.dtype)
+        shift = self.shift.view(shape).to(self.dtype)
+        return torch.addcmul(shift, out, scale, out=out)
+
     def randomize_parameters(self):
         pass
 
@@ -189,12 +411,31 @@ class Scale(object):
     def __call__(self, img):
         """
         Args:
-            img (PIL.Image): Image to be scaled.
+            img (PIL.Image or numpy.ndarray): Image to be scaled.
         Returns:
-            PIL.Image: Rescaled image.
+            PIL.Image or numpy.ndarray: Rescaled image.
         """
+        if isinstance(img, np.ndarray):
+            # frames read from the frame cache are already scaled
+            if img.shape[:2] == (self.size, self.size):
+                return img
+            # resized by PIL, whose BILINEAR filter is antialiased when downscaling (cv2.INTER_LINEAR is not)
+            return np.asarray(Image.fromarray(img).resize((self.size, self.size), self.interpolation))
         return img.resize((self.size, self.size), self.interpolation)
 
+    @property
+    def draft_size(self):
+        return (self.size, self.size)
+
+    def apply_raw_clip(self, clip):
+        # frames read from the frame cache are already scaled
+        if tuple(clip.shape[1:3]) == (self.size, self.size):
+            return clip, True
+        return self.apply_clip(clip.permute(0, 3, 1, 2).float()), False
+
+    def apply_clip(self, clip):
+        return resize_clip(clip, (self.size, self.size))
+
     def randomize_parameters(self):
         pass
 
@@ -226,6 +467,13 @@ class CenterCrop(object):
         y1 = int(round((h - th) / 2.))
         return img.crop((x1, y1, x1 + tw, y1 + th))
 
+    def apply_clip(self, clip):
+        h, w = clip.shape[-2:]
+        th, tw = self.size
+        x1 = int(round((w - tw) / 2.))
+        y1 = int(round((h - th) / 2.))
+        return clip[..., y1:y1 + th, x1:x1 + tw]
+
     def randomize_parameters(self):
         pass
 
@@ -242,9 +490,16 @@ class CornerCrop(object):
         self.crop_positions = ['c', 'tl', 'tr', 'bl', 'br']
 
     def __call__(self, img):
-        image_width = img.size[0]
-        image_height = img.size[1]
+        x1, y1, x2, y2 = self._crop_box(img.size[0], img.size[1])
+        img = img.crop((x1, y1, x2, y2))
+
+        return img
+
+    def apply_clip(self, clip):
+        x1, y1, x2, y2 = self._crop_box(clip.shape[-1], clip.shape[-2])
+        return clip[..., y1:y2, x1:x2]
 
+    def _crop_box(self, image_width, image_height):
         if self.crop_position == 'c':
             th, tw = (self.size, self.size)
             x1 = int(round((image_width - tw) / 2.))
@@ -272,13 +527,11 @@ class CornerCrop(object):
             x2 = image_width
             y2 = image_height
 
-        img = img.crop((x1, y1, x2, y2))
-
-        return img
+        return x1, y1, x2, y2
 
     def randomize_parameters(self):
         if self.randomize:
-            self.crop_position = self.crop_positions[random.randint(
+            self.crop_position = self.crop_positions[get_random().randint(
                 0,
                 len(self.crop_positions) - 1)]
 
@@ -286,6 +539,8 @@ class CornerCrop(object):
 class RandomHorizontalFlip(object):
     """Horizontally flip the given PIL.Image randomly with a probability of 0.5."""
 
+    size_factor = 1.
+
     def __call__(self, img):
         """
         Args:
@@ -297,8 +552,13 @@ class RandomHorizontalFlip(object):
             return img.transpose(Image.FLIP_LEFT_RIGHT)
         return img
 
+    def apply_clip(self, clip):
+        if self.p < 0.5:
+            return clip.flip(-1)
+        return clip
+
     def randomize_parameters(self):
-        self.p = random.random()
+        self.p = get_random().random()
 
 
 class MultiScaleCornerCrop(object):
@@ -324,11 +584,24 @@ class MultiScaleCornerCrop(object):
         self.crop_positions = crop_positions
 
     def __call__(self, img):
-        min_length = min(img.size[0], img.size[1])
-        crop_size = int(min_length * self.scale)
+        x1, y1, x2, y2 = self._crop_box(img.size[0], img.size[1])
+        img = img.crop((x1, y1, x2, y2))
 
-        image_width = img.size[0]
-        image_height = img.size[1]
+        return img.resize((self.size, self.size), self.interpolation)
+
+    @property
+    def draft_size(self):
+        # the smallest crop, of min(scales) times the smaller edge, is scaled to size
+        size = int(math.ceil(self.size / min(self.scales)))
+        return (size, size)
+
+    def apply_clip(self, clip):
+        x1, y1, x2, y2 = self._crop_box(clip.shape[-1], clip.shape[-2])
+        return resize_clip(clip[..., y1:y2, x1:x2], (self.size, self.size))
+
+    def _crop_box(self, image_width, image_height):
+        min_length = min(image_width, image_height)
+        crop_size = int(min_length * self.scale)
 
         if self.crop_position == 'c':
             center_x = image_width // 2
@@ -359,13 +632,11 @@ class MultiScaleCornerCrop(object):
             x2 = image_width
             y2 = image_height
 
-        img = img.crop((x1, y1, x2, y2))
-
-        return img.resize((self.size, self.size), self.interpolation)
+        return x1, y1, x2, y2
 
     def randomize_parameters(self):
-        self.scale = self.scales[random.randint(0, len(self.scales) - 1)]
-        self.crop_position = self.crop_positions[random.randint(
+        self.scale = self.scales[get_random().randint(0, len(self.scales) - 1)]
+        self.crop_position = self.crop_positions[get_random().randint(
             0,
             len(self.scales) - 1)]
 
@@ -393,11 +664,27 @@ class MultiScaleRandomCrop(object):
 
         return img.resize((self.size, self.size), self.interpolation)
 
+    @property
+    def draft_size(self):
+        # the smallest crop, of min(scales) times the smaller edge, is scaled to size
+        size = int(math.ceil(self.size / min(self.scales)))
+        return (size, size)
+
+    def apply_clip(self, clip):
+        image_height, image_width = clip.shape[-2:]
+        crop_size = int(min(image_width, image_height) * self.scale)
+
+        # PIL rounds the coordinates of the crop box
+        x1 = int(round(self.tl_x * (image_width - crop_size)))
+        y1 = int(round(self.tl_y * (image_height - crop_size)))
+
+        return resize_clip(clip[..., y1:y1 + crop_size, x1:x1 + crop_size], (self.size, self.size))
+
     def randomize_parameters(self):
-        self.scale = self.scales[random.randint(0, len(self.scales) - 1)]
+        self.scale = self.scales[get_random().randint(0, len(self.scales) - 1)]
         #self.scale = 1
-        self.tl_x = random.random()
-        self.tl_y = random.random()
+        self.tl_x = get_random().random()
+        self.tl_y = get_random().random()
 
 
 
@@ -441,8 +728,9 @@ class SpatialElasticDisplacement(object):
 
     def _generate_indices(self, shape, alpha, sigma):
         assert (len(shape) == 2),"shape: Should be of size 2!"
-        dx = scipy.ndimage.gaussian_filter((np.random.rand(*shape) * 2 - 1), sigma, mode="constant", cval=0) * alpha
-        dy = scipy.ndimage.gaussian_filter((np.random.rand(*shape) * 2 - 1), sigma, mode="constant", cval=0) * alpha
+        noise = torch.rand((2,) + tuple(shape), generator=get_generator(), dtype=torch.float64).numpy() * 2 - 1
+        dx = scipy.ndimage.gaussian_filter(noise[0], sigma, mode="constant", cval=0) * alpha
+        dy = scipy.ndimage.gaussian_filter(noise[1], sigma, mode="constant", cval=0) * alpha
 
         x, y = np.meshgrid(np.arange(shape[0]), np.arange(shape[1]), indexing='ij')
         return np.reshape(x+dx, (-1, 1)), np.reshape(y+dy, (-1, 1))
@@ -463,12 +751,23 @@ class SpatialElasticDisplacement(object):
             result[..., c] = remapped
         return result
 
+    def apply_clip(self, clip):
+        if self.p < 0.65:
+            # one displacement field for all the frames and channels of the clip
+            t, c, h, w = clip.shape
+            displacement = elastic_displacement(1, h, w, self.sigma, self.alpha, clip.device, get_generator())
+            clip = warp_frames(clip.reshape(1, t * c, h, w), displacement=displacement,
+                               mode=_interpolation_mode(self.order)).view(t, c, h, w)
+        return clip
+
     def randomize_parameters(self):
-       self.p = random.random()
+       self.p = get_random().random()
 
 
 class RandomRotate(object):
 
+    size_factor = 1.
+
     def __init__(self):
         self.interpolation = Image.BILINEAR
 
@@ -478,12 +777,22 @@ class RandomRotate(object):
 
         return ret_img
 
+    def apply_clip(self, clip):
+        if self.rotate_angle == 0:
+            return clip
+        # a single grid for all the frames and channels of the clip
+        t, c, h, w = clip.shape
+        theta = affine_theta([self.rotate_angle], [1.], h, w)
+        return warp_frames(clip.reshape(1, t * c, h, w), theta).view(t, c, h, w)
+
     def randomize_parameters(self):
-        self.rotate_angle = random.randint(-10, 10)
+        self.rotate_angle = get_random().randint(-10, 10)
 
 
 class RandomResize(object):
 
+    size_factor = 0.9       # smallest resize_const
+
     def __init__(self):
         self.interpolation = Image.BILINEAR
 
@@ -494,8 +803,12 @@ class RandomResize(object):
 
         return ret_img
 
+    def apply_clip(self, clip):
+        h, w = clip.shape[-2:]
+        return resize_clip(clip, (int(h * self.resize_const), int(w * self.resize_const)))
+
     def randomize_parameters(self):
-        self.resize_const = random.uniform(0.9, 1.1)
+        self.resize_const = get_random().uniform(0.9, 1.1)
 
 
 
@@ -512,87 +825,204 @@ class Gaussian_blur(object):
             return img
 
     def randomize_parameters(self):
-        self.p = random.random()
-        self.radius = random.uniform(0.0, 0.1)
+        self.p = get_random().random()
+        self.radius = get_random().uniform(0.0, 0.1)
+
+
+def fill_noise(values, ratio, value):
+    """Set each element of the contiguous tensor values to value with probability 1/ratio, in place.
+    The number of noisy elements and their positions are drawn at once for the whole tensor
+    (e.g. a clip), with the generator of the process."""
+    generator = get_generator()
+    flat = values.view(-1)
+    count = torch.binomial(torch.tensor([float(flat.numel())]), torch.tensor([1. / ratio]), generator=generator)
+    positions = torch.randint(flat.numel(), (int(count),), generator=generator)
+    flat.index_fill_(0, positions, value)
+    return values
+
+
+def _fill_image_noise(img, ratio, value):
+    is_PIL = isinstance(img, Image.Image)
+    image = np.array(img)
+    fill_noise(torch.from_numpy(image), ratio, value)
+    if is_PIL:
+        return Image.fromarray(image)
+    return image
 
 
 class SaltImage(object):
+    """Salt noise: for 10% of the clips, each value is set to 255 with probability 1/ratio."""
+
     def __init__(self, ratio=100):
         self.ratio = ratio
 
     def __call__(self, img):
-        is_PIL = isinstance(img, Image.Image)
-        if is_PIL:
-            img = np.asarray(img)
+        if self.p < 0.10:
+            return _fill_image_noise(img, self.ratio, 255)
+        return img
 
+    def apply_raw_clip(self, clip):
         if self.p < 0.10:
-            data_final = []
-            img = img.astype(np.float)
-            img_shape = img.shape
-            noise = np.random.randint(self.ratio, size=img_shape)
-            img = np.where(noise == 0, 255, img)
+            # the frames can be shared (e.g. read from the frame cache), the noise is added to a copy
+            clip = fill_noise(clip.clone(memory_format=torch.contiguous_format), self.ratio, 255)
+        return clip, True
 
-            if is_PIL:
-                return Image.fromarray(img.astype(np.uint8))
-            else:
-                return img
-        else:
-            return img
+    def apply_clip(self, clip):
+        if self.p < 0.10:
+            clip = fill_noise(clip.contiguous(), self.ratio, 255)
+        return clip
 
     def randomize_parameters(self):
-        self.p = random.random()
-        self.ratio = random.randint(80, 120)
+        self.p = get_random().random()
+        self.ratio = get_random().randint(80, 120)
 
 
 class Dropout(object):
+    """Dropout noise: for 10% of the clips, each value is set to 0 with probability 1/ratio."""
 
     def __init__(self, ratio=100):
         self.ratio = ratio
 
     def __call__(self, img):
-        is_PIL = isinstance(img, Image.Image)
-        if is_PIL:
-            img = np.asarray(img)
+        if self.p < 0.10:
+            return _fill_image_noise(img, self.ratio, 0)
+        return img
 
+    def apply_raw_clip(self, clip):
         if self.p < 0.10:
-            data_final = []
-            img = img.astype(np.float)
-            img_shape = img.shape
-            noise = np.random.randint(self.ratio, size=img_shape)
-            img = np.where(noise == 0, 0, img)
-            if is_PIL:
-                return Image.fromarray(img.astype(np.uint8))
-            else:
-                return img
-        else:
-            return img
+            clip = fill_noise(clip.clone(memory_format=torch.contiguous_format), self.ratio, 0)
+        return clip, True
+
+    def apply_clip(self, clip):
+        if self.p < 0.10:
+            clip = fill_noise(clip.contiguous(), self.ratio, 0)
+        return clip
 
     def randomize_parameters(self):
-        self.p = random.random()
-        self.ratio = random.randint(30, 50)
+        self.p = get_random().random()
+        self.ratio = get_random().randint(30, 50)
 
 
 class MultiplyValues():
 
+    size_factor = 1.
+
     def __init__(self, value=0.2, per_channel=False):
         self.value = value
         self.per_channel = per_channel
 
+    def _lookup_table(self):
+        # clipping and truncation of the uint8 conversion, computed once for each of the 256 values
+        return np.floor(np.clip(np.arange(256) * self.sample, 0, 255)).astype(np.uint8)
+
+    def _apply_uint8(self, image):
+        # the frame or clip as a 2D table for cv2.LUT
+        table = np.ascontiguousarray(image).reshape(image.shape[0], -1)
+        return cv2.LUT(table, self._lookup_table()).reshape(image.shape)
+
     def __call__(self, img):
         is_PIL = isinstance(img, Image.Image)
         if is_PIL:
             img = np.asarray(img)
 
-        image = img.astype(np.float64)
-        image *= self.sample
-        image = np.where(image > 255, 255, image)
-        image = np.where(image < 0, 0, image)
-        image = image.astype(np.uint8)
+        image = self._apply_uint8(img.astype(np.uint8, copy=False))
 
         if is_PIL:
             return Image.fromarray(image)
         else:
             return image
 
+    def apply_raw_clip(self, clip):
+        return torch.from_numpy(self._apply_uint8(clip.numpy())), True
+
+    def apply_clip(self, clip):
+        # same clipping and truncation of the uint8 conversion
+        return clip.mul(self.sample).clamp_(0, 255).floor_()
+
     def randomize_parameters(self):
-        self.sample = random.uniform(1.0 - self.value, 1.0 + self.value)
\ No newline at end of file
+        self.sample = get_random().uniform(1.0 - self.value, 1.0 + self.value)
+
+
+class BatchCompose(object):
+    """Composes several batch transforms together.
+    Batch transforms are applied after the collation of the DataLoader, to the whole batch of uint8 clips
+    (B x M x C x T x H x W for the 3D CNNs, B x M x T x C x H x W for the 2D CNNs), on the given device.
+    Args:
+        transforms (list of ``Transform`` objects): list of batch transforms to compose.
+        device (torch.device or string): device on which the transforms are applied.
+    """
+
+    def __init__(self, transforms, device='cpu'):
+        self.transforms = transforms
+        self.device = device
+
+    def __call__(self, batch):
+        batch = batch.to(self.device, non_blocking=True)
+        for t in self.transforms:
+            batch = t(batch)
+        return batch
+
+
+class BatchNormalize(object):
+    """Float conversion and normalization of a batch of clips, i.e. (value / norm_value - mean) / std.
+    Args:
+        norm_value (int): As in ToTensor.
+        mean (sequence): As in Normalize.
+        std (sequence): As in Normalize.
+        channel_dim (int): Dimension of the channels in the batch (2 for the 3D CNNs, 3 for the 2D CNNs).
+    """
+
+    def __init__(self, norm_value=255, mean=(0, 0, 0), std=(1, 1, 1), channel_dim=2):
+        self.channel_dim = channel_dim
+        self.scale = torch.tensor([1. / (norm_value * s) for s in std])
+        self.shift = torch.tensor([-m / s for m, s in zip(mean, std)])
+
+    def __call__(self, batch):
+        shape = [1] * batch.ndim
+        shape[self.channel_dim] = -1
+        scale = self.scale.view(shape).to(batch.device)
+        shift = self.shift.view(shape).to(batch.device)
+        return torch.addcmul(shift, batch.float(), scale)
+
+
+class BatchMultiplyValues(object):
+    """Brightness jitter of MultiplyValues, with a different random factor for each clip of the batch."""
+
+    def __init__(self, value=0.2):
+        self.value = value
+
+    def __call__(self, batch):
+        shape = list(batch.shape[:2]) + [1] * (batch.ndim - 2)
+        sample = torch.empty(shape, device=batch.device).uniform_(1.0 - self.value, 1.0 + self.value)
+        # same clipping and truncation of the uint8 conversion
+        return batch.float().mul_(sample).clamp_(0, 255).floor_()
+
+
+def _clip_frames(batch):
+    """(clips x channels x H x W) view of a batch, with one clip for each sample and modality (the first two dimensions)
+    holding the channels of all its frames."""
+    return batch.float().reshape(batch.shape[0] * batch.shape[1], -1, *batch.shape[-2:])
+
+
+class BatchElasticDisplacement(object):
+    """Elastic displacement of SpatialElasticDisplacement, with one random displacement field for each clip
+    of the batch (shared by its frames), applied with a single grid_sample call.
+    Args:
+        sigma (float): Standard deviation of the gaussian smoothing of the displacements.
+        alpha (float): Largest displacement, in pixels.
+        p (float): Probability of displacing a clip.
+        order (int): Interpolation order (0 nearest, 1 bilinear, 3 bicubic).
+    """
+
+    def __init__(self, sigma=3.0, alpha=1.0, p=0.65, order=3):
+        self.sigma = sigma
+        self.alpha = alpha
+        self.p = p
+        self.order = order
+
+    def __call__(self, batch):
+        frames = _clip_frames(batch)
+        n, h, w = frames.size(0), frames.size(-2), frames.size(-1)
+        displacement = elastic_displacement(n, h, w, self.sigma, self.alpha, frames.device)
+        displacement *= (torch.rand(n, 1, 1, 1, device=frames.device) < self.p)
+        return warp_frames(frames, displacement=displacement, mode=_interpolation_mode(self.order)).view(batch.shape)
@@ -0,0 +1,200 @@
+'''
+Streaming gesture recognition.
+
+The frames of a camera (RGB and optionally depth) are pushed one at a time: each frame is preprocessed as in
+the offline validation (Scale(sample_size), ToTensor and Normalize, in a single ToNormalizedTensor stage) and
+written in a ring buffer holding the last sample_duration * downsample frames of each modality. Every stride
+frames the model (ConsensusModule3DCNN) is run on the latest window, and the class probabilities are smoothed
+with an exponential moving average over the inferences.
+
+    recognizer = StreamingRecognizer(model, ['RGB', 'D'], sample_duration=16, sample_size=112, norm_value=1,
+                                     mean=norm_method.mean, std=norm_method.std, downsample=2, stride=4)
+    for rgb, depth in camera:
+        result = recognizer.push(rgb, depth)
+        if result is not None:
+            print(result['label'], result['score'], result['latency'])
+    print(recognizer.latency.summary())
+'''
+
+import time
+import collections
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from spatial_transforms import Compose, Scale, ToNormalizedTensor
+
+
+class FrameRingBuffer(object):
+    """
+    Ring buffer of the last length preprocessed frames of each modality, in a (M x C x 2 length x H x W) tensor.
+    Each frame is written at its position and at position + length, so the last length frames are always the
+    contiguous slice [position + 1, position + 1 + length) of the buffer, and a window of them is a view of it
+    instead of a copy in chronological order.
+    Args:
+        n_modalities (int): Number of modalities.
+        length (int): Number of frames of each modality kept in the buffer.
+        frame_shape (tuple): (C x H x W) shape of the preprocessed frames.
+        device (torch.device or string): Device of the buffer.
+    """
+
+    def __init__(self, n_modalities, length, frame_shape, device='cpu'):
+        c, h, w = frame_shape
+        self.length = length
+        self.buffer = torch.zeros((n_modalities, c, 2 * length, h, w), device=device)
+        self.count = 0
+
+    @property
+    def full(self):
+        return self.count >= self.length
+
+    def slot(self):
+        """(M x C x 1 x H x W) view of the buffer in which the next frame is written, before calling advance."""
+        position = self.count % self.length
+        return self.buffer[:, :, position:position + 1]
+
+    def advance(self):
+        """Mirrors the frame written in slot and moves to the next position."""
+        position = self.count % self.length
+        self.buffer[:, :, position + self.length] = self.buffer[:, :, position]
+        self.count += 1
+
+    def window(self, downsample=1):
+        """(M x C x T x H x W) view of the last length frames, one every downsample frames, ending at the last frame."""
+        start = (self.count - 1) % self.length + 1
+        return self.buffer[:, :, start + downsample - 1:start + self.length:downsample]
+
+    def reset(self):
+        self.count = 0
+
+
+class LatencyStats(object):
+    """
+    Latencies of the last max_len measures, in seconds.
+    """
+
+    def __init__(self, max_len=1000):
+        self.values = collections.deque(maxlen=max_len)
+
+    def update(self, value):
+        self.values.append(value)
+
+    def summary(self):
+        """Mean, median, 90th and 99th percentiles and maximum of the latencies, in milliseconds."""
+        if len(self.values) == 0:
+            return dict()
+        values = np.array(self.values) * 1000
+        return {
+            'count': len(values),
+            'mean': float(values.mean()),
+            'p50': float(np.percentile(values, 50)),
+            'p90': float(np.percentile(values, 90)),
+            'p99': float(np.percentile(values, 99)),
+            'max': float(values.max()),
+        }
+
+
+def to_rgb_frame(frame):
+    """Converts a camera frame (PIL.Image, or (H x W) / (H x W x C) uint8 array) to 3 channels, as pil_loader
+    converts the depth frames of the datasets."""
+    if isinstance(frame, Image.Image):
+        return frame.convert('RGB')
+    frame = np.asarray(frame)
+    if frame.ndim == 2:
+        frame = frame[..., None]
+    if frame.shape[-1] == 1:
+        frame = np.repeat(frame, 3, axis=-1)
+    return frame
+
+
+class StreamingRecognizer(object):
+    """
+    Args:
+        model (nn.Module): ConsensusModule3DCNN, or a model with the same interface ((B x M x C x T x H x W) input,
+            (scores, ...) output).
+        modalities (list): Modalities of the model, 'RGB' and optionally 'D'.
+        sample_duration (int): Number of frames of the clips of the model.
+        sample_size (int): Height and width of the frames of the model.
+        norm_value (int): As in ToTensor.
+        mean (sequence): As in Normalize.
+        std (sequence): As in Normalize.
+        downsample (int, optional): Temporal stride of the clips, as --downsample.
+        stride (int, optional): Frames between two inferences.
+        smoothing (float, optional): Weight of the previous probabilities in their moving average (0 for none).
+        softmax (bool, optional): If true, the scores of the model are normalized with softmax.
+        device (torch.device or string, optional): Device of the model.
+    """
+
+    def __init__(self, model, modalities, sample_duration, sample_size, norm_value=1, mean=(0, 0, 0), std=(1, 1, 1),
+                 downsample=1, stride=1, smoothing=0.5, softmax=True, device='cpu'):
+        assert all(modality in ['RGB', 'D'] for modality in modalities), 'only the RGB and D streams are supported'
+        self.model = model.eval()
+        self.modalities = modalities
+        self.downsample = downsample
+        self.stride = stride
+        self.smoothing = smoothing
+        self.softmax = softmax
+        self.device = torch.device(device)
+        # the preprocessing of the offline validation, writing the frames in the layout of the 3D CNNs
+        self.transform = Compose([Scale(sample_size), ToNormalizedTensor(norm_value, mean, std, layout='CTHW')])
+        self.frames = FrameRingBuffer(len(modalities), sample_duration * downsample, (3, sample_size, sample_size), self.device)
+        self.latency = LatencyStats()
+        self.preprocessing_time = LatencyStats()
+        self.inference_time = LatencyStats()
+        self.probs = None
+
+    def reset(self):
+        """Starts a new stream."""
+        self.frames.reset()
+        self.probs = None
+
+    def push(self, rgb, depth=None):
+        """
+        Adds the next frame of the stream and runs the model every stride frames, once the buffer is full.
+        Args:
+            rgb (PIL.Image or numpy.ndarray): RGB frame.
+            depth (PIL.Image or numpy.ndarray, optional): Depth frame, required if 'D' is in the modalities.
+        Returns:
+            dict: None if the model was not run, otherwise the number of the frame ('frame'), the probabilities
+            of the window ('probs'), their moving average ('smoothed'), its most likely class ('label', 'score')
+            and the time from the arrival of the frame to the result ('latency', seconds).
+        """
+        start_time = time.time()
+        frames = {'RGB': rgb, 'D': depth}
+        slot = self.frames.slot()
+        for m, modality in enumerate(self.modalities):
+            frame = to_rgb_frame(frames[modality])
+            if self.device.type == 'cpu':
+                self.transform([frame], out=slot[m])
+            else:
+                slot[m].copy_(self.transform([frame]), non_blocking=True)
+        self.frames.advance()
+        self.preprocessing_time.update(time.time() - start_time)
+
+        if not self.frames.full or (self.frames.count - self.frames.length) % self.stride != 0:
+            return None
+
+        inference_time = time.time()
+        with torch.no_grad():
+            outputs = self.model(self.frames.window(self.downsample).unsqueeze(0))
+            scores = outputs[0] if isinstance(outputs, (tuple, list)) else outputs
+            probs = F.softmax(scores, dim=1)[0] if self.softmax else scores[0]
+            probs = probs.cpu()
+        self.inference_time.update(time.time() - inference_time)
+
+        if self.probs is None or self.smoothing == 0:
+            self.probs = probs
+        else:
+            self.probs = self.smoothing * self.probs + (1 - self.smoothing) * probs
+        score, label = self.probs.max(0)
+        latency = time.time() - start_time
+        self.latency.update(latency)
+        return {
+            'frame': self.frames.count - 1,
+            'probs': probs,
+            'smoothed': self.probs,
+            'label': int(label),
+            'score': float(score),
+            'latency': latency,
+        }
@@ -1,26 +1,40 @@
-import random
 import math
+import numpy as np
+import torch
+
+from random_state import get_random, get_generator
+
+
+def loop_indices(frame_indices, begin, end, size, downsample):
+    """Crops frame_indices[begin:end], loops the crop as many times as necessary to cover size * downsample frames,
+    and takes one frame every downsample frames, in closed form.
+    Args:
+        frame_indices (sequence): Frame indices of the video.
+        begin (int or array): First position of the crop in frame_indices, or an array with one for each clip.
+        end (int or array): Last+1 position of the crop.
+        size (int): Number of frames of each clip.
+        downsample (int): Temporal stride.
+    Returns:
+        numpy.ndarray: Frame indices of the clip, (size,), or (n_clips x size) for arrays of begin and end.
+    """
+    frame_indices = np.asarray(frame_indices)
+    begin = np.asarray(begin, dtype=np.int64)
+    length = np.asarray(end, dtype=np.int64) - begin
+    if length.min(initial=1) <= 0:
+        return frame_indices[:0]
+    steps = np.arange(0, size * downsample, downsample)
+    positions = begin[..., None] + steps % length[..., None]
+    return frame_indices[positions]
 
 
 class LoopPadding(object):
 
-    def __init__(self, size, downsample):
+    def __init__(self, size, downsample=1):
         self.size = size
         self.downsample = downsample
 
     def __call__(self, frame_indices):
-        vid_duration  = len(frame_indices)
-        clip_duration = self.size * self.downsample
-        out = frame_indices
-
-        for index in out:
-            if len(out) >= clip_duration:
-                break
-            out.append(index)
-
-        selected_frames = [out[i] for i in range(0, clip_duration, self.downsample)]
-
-        return out
+        return loop_indices(frame_indices, 0, len(frame_indices), self.size, self.downsample)
 
 
 class TemporalBeginCrop(object):
@@ -38,19 +52,8 @@ class TemporalBeginCrop(object):
         self.downsample = downsample
 
     def __call__(self, frame_indices):
-        vid_duration  = len(frame_indices)
         clip_duration = self.size * self.downsample
-
-        out = frame_indices[:clip_duration]
-
-        for index in out:
-            if len(out) >= clip_duration:
-                break
-            out.append(index)
-
-        selected_frames = [out[i] for i in range(0, clip_duration, self.downsample)]
-
-        return selected_frames
+        return loop_indices(frame_indices, 0, min(clip_duration, len(frame_indices)), self.size, self.downsample)
 
 
 class TemporalCenterCrop(object):
@@ -72,25 +75,16 @@ class TemporalCenterCrop(object):
         Args:
             frame_indices (list): frame indices to be cropped.
         Returns:
-            list: Cropped frame indices.
+            numpy.ndarray: Cropped frame indices.
         """
         vid_duration  = len(frame_indices)
         clip_duration = self.size * self.downsample
 
-        center_index = len(frame_indices) // 2
+        center_index = vid_duration // 2
         begin_index = max(0, center_index - (clip_duration // 2))
         end_index = min(begin_index + clip_duration, vid_duration)
 
-        out = frame_indices[begin_index:end_index]
-
-        for index in out:
-            if len(out) >= clip_duration:
-                break
-            out.append(index)
-
-        selected_frames = [out[i] for i in range(0, clip_duration, self.downsample)]
-
-        return selected_frames
+        return loop_indices(frame_indices, begin_index, end_index, self.size, self.downsample)
 
 
 class TemporalRandomCrop(object):
@@ -112,25 +106,91 @@ class TemporalRandomCrop(object):
         Args:
             frame_indices (list): frame indices to be cropped.
         Returns:
-            list: Cropped frame indices.
+            numpy.ndarray: Cropped frame indices.
         """
-        random.seed()   # insert by beis
-        
         vid_duration  = len(frame_indices)
         clip_duration = self.size * self.downsample
 
         rand_end = max(0, vid_duration - clip_duration - 1)
-        
-        begin_index = random.randint(0, rand_end)
+
+        begin_index = get_random().randint(0, rand_end)
         end_index = min(begin_index + clip_duration, vid_duration)
 
-        out = frame_indices[begin_index:end_index]
+        return loop_indices(frame_indices, begin_index, end_index, self.size, self.downsample)
+
+
+class TemporalSegmentSampling(object):
+    """Segment-based sampling (as TSN): the video is split in size segments of equal length and one frame is taken
+    from each segment, at a random position (random_shift) or at its center.
+
+    Args:
+        size (int): Number of segments (and frames) of the clip.
+        random_shift (bool): If true, the position of the frame in each segment is random (training).
+    """
+
+    def __init__(self, size, random_shift=True):
+        self.size = size
+        self.random_shift = random_shift
+
+    def __call__(self, frame_indices):
+        frame_indices = np.asarray(frame_indices)
+        if len(frame_indices) == 0:
+            return frame_indices
+        if self.random_shift:
+            offsets = torch.rand(self.size, dtype=torch.float64, generator=get_generator()).numpy()
+        else:
+            offsets = np.full(self.size, 0.5)
+        positions = np.floor((np.arange(self.size) + offsets) * len(frame_indices) / self.size).astype(np.int64)
+        return frame_indices[np.minimum(positions, len(frame_indices) - 1)]
+
+
+class TemporalMultiClip(object):
+    """Takes n_clips clips of size frames (one every downsample frames) evenly spaced over the video, for
+    multi-clip testing. The clips overlap when the video is shorter than n_clips clips, and are looped as in the
+    crops when it is shorter than one clip.
 
-        for index in out:
-            if len(out) >= clip_duration:
-                break
-            out.append(index)
+    Args:
+        size (int): Number of frames of each clip.
+        downsample (int): Temporal stride.
+        n_clips (int): Number of clips.
+    Returns:
+        numpy.ndarray: (n_clips x size) frame indices, one row for each clip.
+    """
 
-        selected_frames = [out[i] for i in range(0, clip_duration, self.downsample)]
+    def __init__(self, size, downsample, n_clips):
+        self.size = size
+        self.downsample = downsample
+        self.n_clips = n_clips
 
-        return selected_frames
+    def __call__(self, frame_indices):
+        vid_duration = len(frame_indices)
+        clip_duration = self.size * self.downsample
+        begin = np.round(np.linspace(0, max(0, vid_duration - clip_duration), self.n_clips)).astype(np.int64)
+        end = np.minimum(begin + clip_duration, vid_duration)
+        return loop_indices(frame_indices, begin, end, self.size, self.downsample)
+
+
+class TemporalSlidingWindows(object):
+    """Dense sampling for video-level testing: clips of size frames (one every downsample frames) starting every
+    step frames, from the beginning of the video to the last clip that fits in it (looped as in the crops when the
+    video is shorter than one clip).
+
+    Args:
+        size (int): Number of frames of each clip.
+        downsample (int): Temporal stride.
+        step (int): Distance in frames between the beginnings of consecutive clips.
+    Returns:
+        numpy.ndarray: (n_clips x size) frame indices, one row for each clip.
+    """
+
+    def __init__(self, size, downsample, step):
+        self.size = size
+        self.downsample = downsample
+        self.step = step
+
+    def __call__(self, frame_indices):
+        vid_duration = len(frame_indices)
+        clip_duration = self.size * self.downsample
+        begin = np.arange(0, max(0, vid_duration - clip_duration) + 1, self.step)
+        end = np.minimum(begin + clip_duration, vid_duration)
+        return loop_indices(frame_indices, begin, end, self.size, self.downsample)
@@ -8,27 +8,60 @@ import json
 from tqdm import tqdm
 
 from utils import AverageMeter
+from datasets.dense_clips import expand_clips
 
 
-def calculate_video_results(output_buffer, video_id, test_results, class_names, predictions_per_video, predictions):
-    # print('Class name: {}\n'.format(class_names))
-    video_outputs = torch.stack(output_buffer)
-    average_scores = torch.mean(video_outputs, dim=0)
-    sorted_scores, locs = torch.topk(average_scores, k=predictions_per_video)
+def top_k_results(scores, class_names, k):
+    """The k most likely classes of the scores of a video, as {'label', 'score'} dicts."""
+    sorted_scores, locs = torch.topk(scores, k=k)
     # print('LOCS: {}'.format(locs))
-    # print('Shape: {}'.format(average_scores.size()))
 
-    video_results = []
+    results = []
     for i in range(sorted_scores.size(0)):
-        video_results.append({
+        results.append({
             'label': class_names[int(locs[i])],
             'score': float(sorted_scores[i])
         })
+    return results
+
+
+def calculate_video_results(output_buffer, video_id, test_results, class_names, predictions_per_video, predictions):
+    # print('Class name: {}\n'.format(class_names))
+    video_outputs = torch.stack(output_buffer)
+    average_scores = torch.mean(video_outputs, dim=0)
+    # print('Shape: {}'.format(average_scores.size()))
+
     predictions.append(average_scores.tolist())
-    test_results['results'][video_id] = video_results
+    test_results['results'][video_id] = top_k_results(average_scores, class_names, predictions_per_video)
 
 
-def test(data_loader, model, opt, class_names):
+def forward_outputs(model, inputs, opt):
+    if opt.cnn_dim in [0, 3]:
+        # outputs = model(inputs)
+        outputs, cnns_outputs, features_outputs = model(inputs)
+        # outputs, features_outputs = model(inputs)
+    elif opt.cnn_dim == 2:
+        outputs, cnns_outputs = model(inputs)
+    else:
+        print('ERROR: "cnn_dim={}" is not acceptable.'.format(opt.cnn_dim))
+    # print('Type: {}\nShape: {}\nPrediction:\n{}'. format(type(outputs), outputs.shape, outputs))
+    if not opt.no_softmax_in_test:
+        outputs = F.softmax(outputs, dim=1)
+    return outputs
+
+
+def save_test_results(test_results, predictions, opt):
+    # Save predictions
+    predictions = torch.Tensor(predictions)
+    torch.save(predictions, '{}/predictions_{}.pt'.format(opt.result_path, '_'.join(modality for modality in opt.modalities)))
+    
+    with open(
+            os.path.join(opt.result_path, '{}_{}.json'.format(opt.test_subset, '_'.join(modality for modality in opt.modalities))),
+            'w') as f:
+        json.dump(test_results, f)
+
+
+def test(data_loader, model, opt, class_names, device_transform=None):
     # print('test')
 
     model.eval()
@@ -44,20 +77,12 @@ def test(data_loader, model, opt, class_names):
     batch_iter = tqdm(enumerate(data_loader), 'Testing', total=len(data_loader))
     for i, (inputs, targets) in batch_iter:
         data_time.update(time.time() - end_time)
+        if device_transform is not None:
+            inputs = device_transform(inputs)   # uint8 clips, converted and normalized on the device
         with torch.no_grad():
             inputs = Variable(inputs)
         # print('########### Input ###########\nType: {}\nTensor size: {}\n\n#############################'.format(type(inputs), inputs.size()))
-        if opt.cnn_dim in [0, 3]:
-            # outputs = model(inputs)
-            outputs, cnns_outputs, features_outputs = model(inputs)
-            # outputs, features_outputs = model(inputs)
-        elif opt.cnn_dim == 2:
-            outputs, cnns_outputs = model(inputs)
-        else:
-            print('ERROR: "cnn_dim={}" is not acceptable.'.format(opt.cnn_dim))
-        # print('Type: {}\nShape: {}\nPrediction:\n{}'. format(type(outputs), outputs.shape, outputs))
-        if not opt.no_softmax_in_test:
-            outputs = F.softmax(outputs, dim=1)
+        outputs = forward_outputs(model, inputs, opt)
         # print('Type: {}\nShape: {}\nPrediction:\n{}'. format(type(outputs), outputs.shape, outputs))
         for j in range(outputs.size(0)):
             if not (i == 0 and j == 0) and targets[j] != previous_video_id:
@@ -91,11 +116,48 @@ def test(data_loader, model, opt, class_names):
                   batch_time=batch_time,
                   data_time=data_time))
     
-    # Save predictions
-    predictions = torch.Tensor(predictions)
-    torch.save(predictions, '{}/predictions_{}.pt'.format(opt.result_path, '_'.join(modality for modality in opt.modalities)))
-    
-    with open(
-            os.path.join(opt.result_path, '{}_{}.json'.format(opt.test_subset, '_'.join(modality for modality in opt.modalities))),
-            'w') as f:
-        json.dump(test_results, f)
\ No newline at end of file
+    save_test_results(test_results, predictions, opt)
+
+
+def test_videos(data_loader, model, opt, class_names, device_transform=None):
+    """
+    Video-level test on a DenseClipDataset (see datasets/dense_clips.py): the distinct frames of each video are
+    moved to the device once, and its clips, taken from them, are scored opt.batch_size at a time.
+    """
+    model.eval()
+
+    batch_time = AverageMeter()
+    data_time = AverageMeter()
+    clips_count = AverageMeter()
+
+    end_time = time.time()
+    predictions = []
+    test_results = {'results': {}}
+    time_dim = 2 if opt.cnn_dim in [0, 3] else 1
+    batch_iter = tqdm(data_loader, 'Testing', total=len(data_loader))
+    for frames, positions, video_id in batch_iter:
+        data_time.update(time.time() - end_time)
+        if device_transform is not None:
+            frames = device_transform(frames.unsqueeze(0))[0]
+        elif opt.gpu is not None:
+            frames = frames.cuda(non_blocking=True)
+        clips = expand_clips(frames, positions, time_dim)
+        output_buffer = []
+        with torch.no_grad():
+            for begin in range(0, clips.size(0), opt.batch_size):
+                outputs = forward_outputs(model, clips[begin:begin + opt.batch_size], opt)
+                output_buffer.extend(outputs.cpu())
+        calculate_video_results(output_buffer, video_id, test_results, class_names, opt.preds_per_video, predictions)
+        clips_count.update(clips.size(0))
+
+        batch_time.update(time.time() - end_time)
+        end_time = time.time()
+    batch_iter.close()
+
+    ''' Time analysis '''
+    print('Time {batch_time.avg:.3f}\tData {data_time.avg:.3f}\tClips {clips.avg:.1f}\t'.format(
+                  batch_time=batch_time,
+                  data_time=data_time,
+                  clips=clips_count))
+
+    save_test_results(test_results, predictions, opt)
@@ -11,7 +11,7 @@ from torchvision.utils import save_image
 from utils import *
 
 
-def train_epoch(epoch, data_loader, model, criterion, optimizer, opt, epoch_logger, batch_logger):
+def train_epoch(epoch, data_loader, model, criterion, optimizer, opt, epoch_logger, batch_logger, device_transform=None):
     # print('train at epoch {}'.format(epoch))
 
     model.train()
@@ -29,6 +29,8 @@ def train_epoch(epoch, data_loader, model, criterion, optimizer, opt, epoch_logg
 
         if opt.gpu is not None:
             targets = targets.cuda()
+        if device_transform is not None:
+            inputs = device_transform(inputs)   # uint8 clips, converted and normalized on the device
         # print('########### Input ###########\nType: {}\nTensor size: {}\n\n#############################'.format(type(inputs), inputs.size()))
         '''
         for frame in range(inputs.size(3)):
@@ -118,7 +120,7 @@ def regularizer(losses):
     return coeffs
 
     
-def train_epoch_custom_loss(epoch, data_loader, model, criterion, optimizers, opt, epoch_logger, batch_logger):
+def train_epoch_custom_loss(epoch, data_loader, model, criterion, optimizers, opt, epoch_logger, batch_logger, device_transform=None):
     # print('##########\nCriterion: {}\nOptimizers: {}\n#########\n'.format(criterion, optimizers))
     # print('train at epoch {}'.format(epoch))
     _lambda = 9e-5
@@ -145,6 +147,8 @@ def train_epoch_custom_loss(epoch, data_loader, model, criterion, optimizers, op
 
         if not opt.no_cuda:
             targets = targets.cuda()
+        if device_transform is not None:
+            inputs = device_transform(inputs)   # uint8 clips, converted and normalized on the device
         # print('########### Input ###########\nType: {}\nTensor size: {}\n\n#############################'.format(type(inputs), inputs.size()))
         inputs = Variable(inputs)
         targets = Variable(targets)
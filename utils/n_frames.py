@@ -0,0 +1,118 @@
+'''
+Count the frames of every video of a dataset and write them in a single index, <dataset>/n_frames.json,
+read by the dataloaders instead of the n_frames file of each folder:
+
+{
+    "dataset": "isogd",
+    "videos": {
+        "train/001/M_00001": {"RGB": 45, "D": 45, "OF": 44, "OF_D": 44, "MHI": 45, "MHI_D": 45, "mismatch": false},
+        ...
+    }
+}
+
+The videos are named as in the annotation files (the color video for RGB and D), and "mismatch" flags the videos
+whose color and depth streams have a different number of frames. The class folders are counted in parallel.
+
+python3 utils/n_frames.py isogd ../datasets/isogd
+python3 utils/n_frames.py nvgesture ../datasets/nvgesture
+python3 utils/n_frames.py jester ../datasets/jester
+'''
+from __future__ import print_function, division
+import os
+import sys
+import re
+import json
+from multiprocessing import Pool, cpu_count
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from datasets.frame_store import FRAME_COUNTS_NAME
+
+
+FRAME_PATTERN = re.compile(r'(\d+)\.jpg$')      # image_00001.jpg (IsoGD, NVGesture) or 00001.jpg (Jester)
+# modality of the color and of the depth frames of each folder
+MODALITY_FOLDERS = {
+    'RGB-D_frames': ('RGB', 'D'),
+    'OF_frames': ('OF', 'OF_D'),
+    'MHI_frames': ('MHI', 'MHI_D'),
+    'RGB_frames': ('RGB', None),
+}
+# depth of the class folders in the modality folders, and (color, depth) tokens of the video names
+CLASS_DEPTH = {'isogd': 2, 'nvgesture': 1, 'jester': 1}
+DEPTH_NAMES = {'isogd': ('M_', 'K_'), 'nvgesture': ('color', 'depth'), 'jester': None}
+
+
+def list_dirs(dir_path, depth):
+    if depth == 0:
+        return [dir_path]
+    dirs = []
+    for entry in os.scandir(dir_path):
+        if entry.is_dir():
+            dirs.extend(list_dirs(entry.path, depth - 1))
+    return dirs
+
+
+def count_frames(dir_path):
+    """
+    Returns the number of frames (largest frame id) of each folder of frames found under dir_path.
+    """
+    counts = dict()
+    n_frames = 0
+    for entry in os.scandir(dir_path):
+        if entry.is_dir():
+            counts.update(count_frames(entry.path))
+            continue
+        match = FRAME_PATTERN.search(entry.name)
+        if match is not None:
+            n_frames = max(n_frames, int(match.group(1)))
+    if n_frames > 0:
+        counts[dir_path] = n_frames
+    return counts
+
+
+def video_key(dataset, video_name):
+    """
+    Returns the name of the video in the annotation file, and whether the folder holds depth frames.
+    """
+    names = DEPTH_NAMES[dataset]
+    if names is None:
+        return video_name, False
+    head, tail = os.path.split(video_name)
+    if names[1] in tail:
+        return '/'.join([head, tail.replace(names[1], names[0])]).lstrip('/'), True
+    return video_name, False
+
+
+if __name__ == "__main__":
+    dataset = sys.argv[1]
+    dir_path = sys.argv[2]
+    n_jobs = int(sys.argv[3]) if len(sys.argv) > 3 else cpu_count()
+    assert dataset in CLASS_DEPTH
+
+    videos = dict()
+    with Pool(n_jobs) as pool:
+        for folder, (modality, depth_modality) in MODALITY_FOLDERS.items():
+            modality_path = os.path.join(dir_path, folder)
+            if not os.path.isdir(modality_path):
+                continue
+            class_paths = list_dirs(modality_path, CLASS_DEPTH[dataset])
+            counts_iter = tqdm(pool.imap_unordered(count_frames, class_paths, chunksize=16), '{} count'.format(folder),
+                               total=len(class_paths))
+            for counts in counts_iter:
+                for video_dir_path, n_frames in counts.items():
+                    video_name = os.path.relpath(video_dir_path, modality_path).replace(os.sep, '/')
+                    key, is_depth = video_key(dataset, video_name)
+                    videos.setdefault(key, dict())[depth_modality if is_depth else modality] = n_frames
+
+    n_mismatches = 0
+    for key, counts in videos.items():
+        counts['mismatch'] = 'D' in counts and counts.get('RGB') != counts['D']
+        n_mismatches += counts['mismatch']
+
+    with open(os.path.join(dir_path, FRAME_COUNTS_NAME), 'w') as dst_file:
+        json.dump({'dataset': dataset, 'videos': videos}, dst_file)
+
+    n_frames = [counts['RGB'] for counts in videos.values() if 'RGB' in counts]
+    if len(n_frames) > 0:
+        print('Average number of frame per video: {}'.format(sum(n_frames) / len(n_frames)))
+    print('{} videos, {} with a different number of RGB and D frames'.format(len(videos), n_mismatches))
@@ -19,9 +19,9 @@ def class_process(dir_path, class_name, total_frames, n_videos):
 
     for file_name in os.listdir(class_path):
         video_dir_path = os.path.join(class_path, file_name)    # i am in a subject with al the frames related to a video
-        image_indices = []
         
         for modality in ['sk_color', 'sk_depth']:
+            image_indices = []
             mod_video_dir_path = os.path.join(video_dir_path, modality)     # i am in a modality folder
             if not os.path.isdir(mod_video_dir_path):
                 # print('1: {}'.format(mod_video_dir_path))
@@ -0,0 +1,63 @@
+'''
+Pack each folder of frames in a single file (see datasets/frame_store.py for the format).
+The modality trees (RGB-D_frames, OF_frames, MHI_frames, RGB_frames) found in the dataset folder are walked,
+and for each folder containing jpg frames a "<folder>.pack" file is written in the destination tree.
+If the destination is not given, the packs are written next to the frame folders.
+
+python3 utils/pack_frames.py ../datasets/nvgesture
+python3 utils/pack_frames.py ../datasets/isogd ../datasets/isogd_packed
+'''
+from __future__ import print_function, division
+import os
+import sys
+import re
+from tqdm import tqdm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from datasets.frame_store import write_pack, get_pack_path
+
+
+MODALITY_FOLDERS = ['RGB-D_frames', 'OF_frames', 'MHI_frames', 'RGB_frames']
+FRAME_PATTERN = re.compile(r'(\d+)\.jpg$')      # image_00001.jpg (IsoGD, NVGesture) or 00001.jpg (Jester)
+
+
+def video_process(video_dir_path, dst_video_dir_path, frame_names):
+    pack_path = get_pack_path(dst_video_dir_path)
+    if os.path.exists(pack_path):
+        return 0
+
+    frames = list()
+    for frame_name in frame_names:
+        match = FRAME_PATTERN.search(frame_name)
+        if match is None:
+            continue
+        with open(os.path.join(video_dir_path, frame_name), 'rb') as f:
+            frames.append((int(match.group(1)), f.read()))
+
+    os.makedirs(os.path.dirname(pack_path), exist_ok=True)
+    write_pack(pack_path, frames)
+    return len(frames)
+
+
+if __name__ == "__main__":
+    dir_path = sys.argv[1]
+    dst_dir_path = sys.argv[2] if len(sys.argv) > 2 else dir_path
+    total_frames = 0
+    n_videos = 0
+
+    for folder in MODALITY_FOLDERS:
+        modality_path = os.path.join(dir_path, folder)
+        if not os.path.isdir(modality_path):
+            continue
+
+        files_iter = tqdm(os.walk(modality_path))
+        for video_dir_path, _, file_names in files_iter:
+            frame_names = [file_name for file_name in file_names if file_name.endswith('.jpg')]
+            if len(frame_names) == 0:
+                continue
+            dst_video_dir_path = os.path.join(dst_dir_path, os.path.relpath(video_dir_path, dir_path))
+            total_frames += video_process(video_dir_path, dst_video_dir_path, frame_names)
+            n_videos += 1
+            files_iter.set_description('{} packing'.format(folder))
+
+    print('Packed {} frames of {} videos'.format(total_frames, n_videos))
@@ -1,81 +1,99 @@
 '''
     Convert video.avi in folder of its streams.
-    python3 utils/video_jpg_chalearn_isogd.py datasets/chalearn_isogd datasets/chalearn_isogd_frame_video
+    The videos are converted in parallel, one ffmpeg process for each core (or n_jobs). Each video is extracted
+    in a temporary folder, renamed to its final name once complete together with its n_frames file
+    (so utils/n_frames_chalearn_isogd.py is not needed after the conversion).
+    The converted videos are listed in <jpg_video_directory>/extracted.txt: an interrupted conversion is resumed
+    by running the same command again.
+    python3 utils/video_jpg_chalearn_isogd.py datasets/chalearn_isogd datasets/chalearn_isogd_frame_video [n_jobs]
 '''
 
 from __future__ import print_function, division
 import os
 import sys
+import shutil
 import subprocess
+from multiprocessing import Pool, cpu_count
 from tqdm import tqdm
 
 
-def class_process(dir_path, dst_dir_path, class_name):
-    class_path = os.path.join(dir_path, class_name)  # arrive in folder with video.avi
-    if not os.path.isdir(class_path):
-        return
+MANIFEST_NAME = 'extracted.txt'
+SUBSETS = [('train', 'Training set conversion'), ('valid', 'Validation set conversion'), ('test', 'Testing set conversion')]
 
-    dst_class_path = os.path.join(dst_dir_path, class_name)
-    if not os.path.exists(dst_class_path):
-        os.mkdir(dst_class_path)
-    
-    for file_name in os.listdir(class_path):  # for each video.avi in video folder
-        if '.avi' not in file_name:  # check if the file is a video.avi
-            continue
-        name, ext = os.path.splitext(file_name)
-        dst_directory_path = os.path.join(dst_class_path,
-                                          name)  # a subfolder is created for each video.avi, which will contain the rgb frames
-
-        video_file_path = os.path.join(class_path, file_name)  # build video path
-        try:
-            if os.path.exists(dst_directory_path):
-                if not os.path.exists(os.path.join(dst_directory_path, 'image_00001.jpg')):
-                    subprocess.call('rm -r \"{}\"'.format(dst_directory_path), shell=True)
-                    print('remove {}'.format(dst_directory_path))
-                    os.mkdir(dst_directory_path)
-                else:
-                    continue
-            else:
-                os.mkdir(dst_directory_path)
-        except:
-            print(dst_directory_path)
+
+def video_process(video_file_path, dst_directory_path):
+    """
+    Extracts the frames of a video in dst_directory_path, with the n_frames file.
+    Returns the number of frames, 0 if the conversion failed.
+    """
+    tmp_directory_path = dst_directory_path + '.tmp'
+    shutil.rmtree(tmp_directory_path, ignore_errors=True)   # left by an interrupted conversion
+    os.makedirs(tmp_directory_path)
+
+    cmd = ['ffmpeg', '-loglevel', 'error', '-i', video_file_path, '-vf', 'scale=-1:240',
+           os.path.join(tmp_directory_path, 'image_%05d.jpg')]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    n_frames = sum(1 for entry in os.scandir(tmp_directory_path) if entry.name.startswith('image_'))
+    if result.returncode != 0 or n_frames == 0:
+        shutil.rmtree(tmp_directory_path, ignore_errors=True)
+        return 0
+
+    with open(os.path.join(tmp_directory_path, 'n_frames'), 'w') as dst_file:
+        dst_file.write(str(n_frames))
+    shutil.rmtree(dst_directory_path, ignore_errors=True)   # incomplete folder of a previous conversion
+    os.replace(tmp_directory_path, dst_directory_path)
+    return n_frames
+
+
+def job_process(job):
+    video_name, video_file_path, dst_directory_path = job
+    return video_name, video_process(video_file_path, dst_directory_path)
+
+
+def list_videos(dir_path, dst_dir_path, subset):
+    """
+    Returns the (video name, video path, frame folder) of each video.avi of the subset, the video name
+    being the path relative to the subset folder (e.g. train/001/M_00001).
+    """
+    jobs = []
+    subset_path = os.path.join(dir_path, subset)
+    if not os.path.isdir(subset_path):
+        return jobs
+    for class_entry in os.scandir(subset_path):
+        if not class_entry.is_dir():
             continue
-        cmd = 'ffmpeg -i \"{}\" -vf scale=-1:240 \"{}/image_%05d.jpg\"'.format(video_file_path, dst_directory_path)
-        # print(cmd)
-        subprocess.call(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-        # print('\n')
+        for entry in os.scandir(class_entry.path):  # for each video.avi in video folder
+            if not entry.name.endswith('.avi'):
+                continue
+            name, ext = os.path.splitext(entry.name)
+            video_name = '/'.join([subset, class_entry.name, name])
+            jobs.append((video_name, entry.path, os.path.join(dst_dir_path, subset, class_entry.name, name)))
+    return jobs
 
 
 if __name__ == "__main__":
     dir_path = sys.argv[1]  # avi_video_directory
     dst_dir_path = sys.argv[2]  # jpg_video_directory
+    n_jobs = int(sys.argv[3]) if len(sys.argv) > 3 else cpu_count()
+
+    os.makedirs(dst_dir_path, exist_ok=True)
+    manifest_path = os.path.join(dst_dir_path, MANIFEST_NAME)
+    extracted = set()
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as manifest_file:
+            extracted = set(line.strip() for line in manifest_file)
+
+    failed = []
+    with Pool(n_jobs) as pool, open(manifest_path, 'a') as manifest_file:
+        for subset, description in SUBSETS:
+            jobs = [job for job in list_videos(dir_path, dst_dir_path, subset) if job[0] not in extracted]
+            results_iter = tqdm(pool.imap_unordered(job_process, jobs), description, total=len(jobs))
+            for video_name, n_frames in results_iter:
+                if n_frames == 0:
+                    failed.append(video_name)
+                    continue
+                manifest_file.write(video_name + '\n')
+                manifest_file.flush()   # a video is listed only once its folder is complete
 
-    # Training set
-    train_dir_path = os.path.join(dir_path, 'train')
-    train_dst_dir_path = os.path.join(dst_dir_path, 'train')
-    if not os.path.exists(train_dst_dir_path):
-        os.mkdir(train_dst_dir_path)
-    files_iter = tqdm(os.listdir(train_dir_path))
-    for class_name in files_iter:  # for each directory in directory list
-        class_process(train_dir_path, train_dst_dir_path, class_name)
-        files_iter.set_description('Training set conversion')
-
-    # Validation set
-    valid_dir_path = os.path.join(dir_path, 'valid')
-    valid_dst_dir_path = os.path.join(dst_dir_path, 'valid')
-    if not os.path.exists(valid_dst_dir_path):
-        os.mkdir(valid_dst_dir_path)
-    files_iter = tqdm(os.listdir(valid_dir_path))
-    for class_name in files_iter:  # for each directory in directory list
-        class_process(valid_dir_path, valid_dst_dir_path, class_name)
-        files_iter.set_description('Validation set conversion')
-
-    # Testing set
-    test_dir_path = os.path.join(dir_path, 'test')
-    test_dst_dir_path = os.path.join(dst_dir_path, 'test')
-    if not os.path.exists(test_dst_dir_path):
-        os.mkdir(test_dst_dir_path)
-    files_iter = tqdm(os.listdir(test_dir_path))
-    for class_name in files_iter:  # for each directory in directory list
-        class_process(test_dir_path, test_dst_dir_path, class_name)
-        files_iter.set_description('Testing set conversion')
+    for video_name in failed:
+        print('conversion failed: {}'.format(video_name))
@@ -7,7 +7,7 @@ from tqdm import tqdm
 from utils import *
 
 
-def val_epoch(epoch, data_loader, model, criterion, opt, logger):
+def val_epoch(epoch, data_loader, model, criterion, opt, logger, device_transform=None):
     # print('validation at epoch {}'.format(epoch))
 
     model.eval()
@@ -29,6 +29,8 @@ def val_epoch(epoch, data_loader, model, criterion, opt, logger):
 
         if opt.gpu is not None:
             targets = targets.cuda()
+        if device_transform is not None:
+            inputs = device_transform(inputs)   # uint8 clips, converted and normalized on the device
         with torch.no_grad():
             inputs = Variable(inputs)
             targets = Variable(targets)